@@ -1,18 +1,53 @@
 import os
 import re
+import sys
+import atexit
+import queue
+import logging
+import logging.handlers
 import threading
 import json
+import math
+import orjson
 import sqlite3
-import traceback
+import time
+import mimetypes
+from urllib.parse import quote
 from difflib import SequenceMatcher
-from flask import Flask, jsonify, send_from_directory, request, g
+from flask import Flask, jsonify, send_from_directory, request, g, Response, stream_with_context
 from flask_cors import CORS
 from flask_compress import Compress
 from werkzeug.utils import safe_join
+from werkzeug.exceptions import NotFound
 import secrets, hashlib
-from functools import wraps
+from functools import wraps, lru_cache
+from contextlib import contextmanager
 from datetime import datetime, timedelta, timezone
 
+# --- 日志 ---
+# 生产环境用 INFO；排查问题时改成 logging.DEBUG 可看到每个请求的下载/版本检查明细
+LOG_LEVEL = logging.INFO
+logger = logging.getLogger(__name__)
+
+def setup_logging(level=LOG_LEVEL):
+    """
+    【性能】请求线程只把日志记录放进内存队列，由 QueueListener 后台线程统一写 stdout，
+    请求路径上不再有 print 的同步 write 系统调用。重复调用无副作用。
+    """
+    root = logging.getLogger()
+    if any(isinstance(h, logging.handlers.QueueHandler) for h in root.handlers):
+        return
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(message)s'))
+    listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    listener.start()
+    atexit.register(listener.stop)   # 退出前把队列里剩余的日志刷出去
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level)
+
+setup_logging()
+
 app = Flask(__name__)
 # 以北京时间作为"每日免费次数"的统一基准，不再依赖服务器系统时区
 APP_TZ = timezone(timedelta(hours=8))
@@ -22,6 +57,11 @@ _last_unlock_cleanup_date = None
 # 【新增】初始化 Gzip 压缩
 # 这会自动压缩 application/json, text/csv, text/plain 等响应
 # 默认压缩级别为 6，足以大幅减小文本文件体积
+# 【性能】客户端带 Accept-Encoding: zstd 时优先用 zstd (级别 3)：大批量 JSON（行情/历史数据）
+# 压缩比与 gzip 相当甚至更好，CPU 开销低得多；不支持的客户端按顺序回落到 br/gzip
+app.config['COMPRESS_ALGORITHM'] = ['zstd', 'br', 'gzip', 'deflate']
+app.config['COMPRESS_ALGORITHM_STREAMING'] = ['zstd', 'br', 'deflate']   # 流式响应 (如期权历史) 不支持 gzip
+app.config['COMPRESS_ZSTD_LEVEL'] = 3
 Compress(app)
 
 # --- 配置 ---
@@ -33,18 +73,27 @@ PARENT_DIR = os.path.dirname(CURRENT_DIR)
 
 BASE_RESOURCES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Resources')
 
+# 部署在 nginx 后面时，下载交给 nginx 发送（X-Accel-Redirect）。None 表示由 Flask 自己发送（直接运行本文件调试时）。
+# gunicorn.conf.py 通过 raw_env 设为 '/protected'，对应 nginx.conf 中的:
+#   location /protected/ { internal; alias /root/LocalServer/Resources/; }
+X_ACCEL_REDIRECT_PREFIX = os.environ.get('APP_X_ACCEL_PREFIX') or None
+
 # 活跃用户明细/流水仅保留最近 N 天（可配置）
 ANALYTICS_LOG_KEEP_DAYS = 7
 
-ALLOWED_APPS = ['ONews', 'Finance', 'Prediction', 'OVideo']
-ALLOWED_EVENT_TYPES = {'play', 'download_complete'}
+# 【性能】只做成员判断的常量一律用 frozenset，O(1) 查找且不可被误改
+ALLOWED_APPS = frozenset({'ONews', 'Finance', 'Prediction', 'OVideo'})
+ALLOWED_EVENT_TYPES = frozenset({'play', 'download_complete'})
 # 【修改】移除了 'read'，仅保留 view, listen
-ALLOWED_NEWS_EVENT_TYPES = {'view', 'listen'}
-ALLOWED_REPORT_TYPES = {'playback_failed', 'download_failed', 'media_error', 'content_mismatch', 'other'}
-ALLOWED_FINANCE_EVENT_TYPES = {'click'}
+ALLOWED_NEWS_EVENT_TYPES = frozenset({'view', 'listen'})
+ALLOWED_REPORT_TYPES = frozenset({'playback_failed', 'download_failed', 'media_error', 'content_mismatch', 'other'})
+ALLOWED_FINANCE_EVENT_TYPES = frozenset({'click'})
 report_last_time = {}  # 内存软限流: user_id -> 最近提交时间戳
 wish_last_time = {}   # 内存软限流: user_id -> 最近提交时间戳
 
+# 拥有独立订阅字段 ({prefix}_is_permanent / {prefix}_expire_at / {prefix}_expire_ts) 的应用
+SUBSCRIPTION_APP_PREFIXES = ('finance', 'onews', 'prediction')
+
 # 【新增】用户数据库路径
 USER_DB_PATH = os.path.join(PARENT_DIR, 'user_data.db')
 ANALYTICS_DB_PATH = os.path.join(PARENT_DIR, 'analytics.db')
@@ -61,11 +110,21 @@ VALID_INVITE_CODES = {
     "VIP_FRIEND_888": "Friend Access",
     "DEV_TEST_KEY": "Developer Key"
 }
+# 邀请码防爆破：同一客户端地址在窗口期内输错达到上限后直接 429，不再逐个尝试
+# （不能按 user_id 计：错误的邀请码在查用户之前就被拒绝，换个 user_id 就能绕过）
+INVITE_FAIL_WINDOW = 600   # 秒
+INVITE_FAIL_LIMIT = 5
+INVITE_FAIL_LOG_MAX = 10000
+# 内存软限流: ip -> (窗口起点时间戳, 窗口内输错次数)；按窗口起点先后插入，最老的在最前面
+invite_fail_log = {}
+_invite_fail_lock = threading.Lock()
+# 本机反向代理（见 nginx.conf）：经它转发的请求从 X-Forwarded-For 取真实客户端地址
+TRUSTED_PROXY_ADDRS = frozenset({'127.0.0.1', '::1'})
 
 # 视频模块黑名单：这些用户即使是永久 VIP 也看不到视频模块
-VIDEO_MODULE_BLOCKED_USERS = {
+VIDEO_MODULE_BLOCKED_USERS = frozenset({
     "001356.cdec6d350edb4646b0130f9363b6d37e.2149",
-}
+})
 
 # Featured 首页「按上映日期」排序时:
 # Drama 分类改用 (更新日期 − N 天) 作为排序键,N 可在此调整
@@ -75,7 +134,7 @@ FEATURED_DRAMA_DATE_OFFSET_DAYS = 1
 INVITE_ALPHABET = "ABCDEFGHJKMNPQRSTUVWXYZ23456789"
 
 # 美股节假日（必须与客户端 TradingDateHelper.holidays 保持一致）
-US_MARKET_HOLIDAYS = {
+US_MARKET_HOLIDAYS = frozenset({
     "2026-01-01", "2026-01-19", "2026-02-16", "2026-04-03",
     "2026-05-25", "2026-06-19", "2026-07-03", "2026-09-07",
     "2026-11-26", "2026-12-25",
@@ -88,7 +147,7 @@ US_MARKET_HOLIDAYS = {
     "2029-01-01", "2029-01-15", "2029-02-19", "2029-03-30",
     "2029-05-28", "2029-06-19", "2029-07-04", "2029-09-03",
     "2029-11-22", "2029-12-25",
-}
+})
 
 def is_free_access_day():
     """服务器权威判断：北京时间今天是否为免点数日。
@@ -100,12 +159,36 @@ def is_free_access_day():
     is_holiday = ref_str in US_MARKET_HOLIDAYS
     return is_weekend or is_holiday
 
+# version.json 解析结果缓存：path -> ((st_mtime_ns, st_size), data)，文件变化时自动失效
+# 各种配置读取 (点数/免费次数/屏蔽) 和 check_version 都走这里，同一份文件只在变化后用 orjson 重新解析一次
+_version_json_cache = {}
+VERSION_JSON_MAX_AGE = 60   # 客户端缓存秒数，过期后凭 ETag 重新验证
+
+def _load_version_json(path):
+    """返回 (file_key, data)，文件不存在时返回 None；data 为共享对象，调用方不要直接修改"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    file_key = (st.st_mtime_ns, st.st_size)
+    cached = _version_json_cache.get(path)
+    if cached is None or cached[0] != file_key:
+        with open(path, 'rb') as f:
+            cached = _version_json_cache[path] = (file_key, orjson.loads(f.read()))
+    return cached
+
+def load_version_data(path):
+    """返回解析后的 version.json 内容（共享只读对象）；文件不存在时抛 FileNotFoundError"""
+    loaded = _load_version_json(path)
+    if loaded is None:
+        raise FileNotFoundError(path)
+    return loaded[1]
+
 def get_finance_config():
     """读取 Finance/version.json 中与点数/邀请相关的配置"""
     path = os.path.join(BASE_RESOURCES_DIR, 'Finance', 'version.json')
     try:
-        with open(path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        data = load_version_data(path)
         return {
             'daily_free_limit': int(data.get('daily_free_limit', 25)),
             'bonus_points': int(data.get('bonus_points', 0)),
@@ -114,12 +197,12 @@ def get_finance_config():
             'sector_cost_overrides': data.get('sector_cost_overrides', {}) or {},
         }
     except Exception as e:
-        print(f"读取 Finance 配置失败: {e}")
+        logger.warning("读取 Finance 配置失败: %s", e)
         return {'daily_free_limit': 25, 'bonus_points': 0, 'invite_reward_points': 300,
                 'cost_config': {}, 'sector_cost_overrides': {}}
 
 # 使用分组独立扣点的动作
-_SECTOR_OVERRIDE_ACTIONS = {'open_sector', 'open_special_list', 'view_big_orders'}
+_SECTOR_OVERRIDE_ACTIONS = frozenset({'open_sector', 'open_special_list', 'view_big_orders'})
 
 def finance_calc_cost(cfg, action, item_key):
     """服务器权威地计算单次扣点"""
@@ -172,7 +255,7 @@ def _log_finance_invite(inviter_id, code, invitee_id, points):
         conn.commit()
         conn.close()
     except Exception as e:
-        print(f"记录邀请日志失败: {e}")
+        logger.warning("记录邀请日志失败: %s", e)
 
 def is_real_login_user(user_id):
     """只有 Apple 登录用户(稳定 Apple ID)才享受免费次数。
@@ -195,9 +278,9 @@ def cleanup_old_event_logs(days_to_keep=ANALYTICS_LOG_KEEP_DAYS):
             total += c.rowcount
         conn.commit()
         if total:
-            print(f"[cleanup] 已清理 {total} 条过期流水 (< {cutoff})")
+            logger.info("[cleanup] 已清理 %s 条过期流水 (< %s)", total, cutoff)
     except Exception as e:
-        print(f"[cleanup] 流水清理失败: {e}")
+        logger.error("[cleanup] 流水清理失败: %s", e)
     finally:
         conn.close()
 
@@ -211,9 +294,9 @@ def cleanup_old_unlocks(days_to_keep=7):
         deleted = c.rowcount
         conn.commit()
         if deleted:
-            print(f"[cleanup] 已清理 {deleted} 条过期解锁记录 (< {cutoff})")
+            logger.info("[cleanup] 已清理 %s 条过期解锁记录 (< %s)", deleted, cutoff)
     except Exception as e:
-        print(f"[cleanup] 清理失败: {e}")
+        logger.error("[cleanup] 清理失败: %s", e)
     finally:
         conn.close()
 
@@ -247,119 +330,391 @@ def require_admin(f):
         return f(*args, **kwargs)
     return wrapper
 
+def ojsonify(obj, status=200):
+    """orjson 版 jsonify：C 实现编码，且不做 key 排序，用于高频的登录/状态接口"""
+    return app.response_class(orjson.dumps(obj), status=status, mimetype='application/json')
+
+# 【性能】连接级 PRAGMA：内存临时表 + 256MB mmap + 约 20MB 页缓存（负数单位为 KiB）
+_CONN_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-20000",
+)
+
+def _tune_conn(conn):
+    for pragma in _CONN_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+# 【性能】按线程缓存 SQLite 长连接（按库路径区分），避免每个请求都 connect/close
+_db_local = threading.local()
+
+# 【性能】长连接的预编译语句缓存（sqlite3 默认 128 条）。Finance 查询的 SQL 按表名各自生成，
+# 表多时默认容量会被挤出，重复请求又要重新 prepare；放大后同一条 SQL 文本始终命中缓存
+CONN_CACHED_STATEMENTS = 1024
+
+def get_conn(path, ident=None, pragmas=(), read_only=False):
+    """返回当前线程针对 path 的复用连接；首次调用时建立。
+       isolation_level=None 即自动提交，需要事务的地方自行 BEGIN IMMEDIATE。
+       ident 变化（如库文件被整体替换后 inode 不同）时丢弃旧连接重新打开。
+       PRAGMA（_CONN_PRAGMAS + pragmas）只在建立连接时执行一次，复用时不再重复。
+       read_only=True 时以 URI mode=ro 打开：库文件不存在时报错而不是新建空库，任何写入都会被拒绝。"""
+    conns = getattr(_db_local, 'conns', None)
+    if conns is None:
+        conns = _db_local.conns = {}
+    cached = conns.get(path)
+    if cached is not None and cached[1] == ident:
+        return cached[0]
+    if cached is not None:
+        cached[0].close()
+    target = f"file:{quote(path)}?mode=ro" if read_only else path
+    conn = sqlite3.connect(target, timeout=60.0, check_same_thread=False, isolation_level=None,
+                           cached_statements=CONN_CACHED_STATEMENTS, uri=read_only)
+    conn.row_factory = sqlite3.Row
+    _tune_conn(conn)
+    for pragma in pragmas:
+        conn.execute(pragma)
+    conns[path] = (conn, ident)
+    return conn
+
+# 数据同步整体替换 Finance.db 后，新文件里没有服务端补建的索引/统计信息，查询会退回全表扫描。
+# 按 inode 记录已经补过索引的库文件，发现新 inode 时（每个进程一次）在后台线程重新执行 _maintain_finance_db。
+# 【关键】补建（CREATE INDEX/ANALYZE 大库要几秒）不在请求线程里跑：请求路径对 Finance.db 始终只读、不等待
+FINANCE_INDEX_RETRY_INTERVAL = 60   # 秒；补建失败（如导入脚本正持有写锁）后最多这么久重试一次
+FINANCE_INDEX_BUSY_TIMEOUT = 2.0    # 秒；补建连接等写锁的上限，导入脚本在写时尽快放弃、下次再试
+_finance_indexed_ino = None
+_finance_index_attempt = None   # 最近一次补建的 (inode, time.monotonic())，用于失败后的重试间隔
+_finance_index_lock = threading.Lock()   # 持有者即正在补建的线程（后台线程结束时释放）
+
+def _run_finance_maintenance(ino):
+    """在已持有 _finance_index_lock 的前提下补建索引，结束时释放锁"""
+    global _finance_indexed_ino
+    try:
+        if _maintain_finance_db():
+            _finance_indexed_ino = ino
+    finally:
+        _finance_index_lock.release()
+
+def ensure_finance_indexes(ino, force=False):
+    """确保 inode 为 ino 的 Finance.db 已补建索引。
+       默认非阻塞：已有线程在补建或还在重试间隔内时直接返回，否则交给后台线程执行；
+       force=True（启动、flush 接口）时等待锁并在当前线程同步执行"""
+    global _finance_index_attempt
+    if not _finance_index_lock.acquire(blocking=force):
+        return
+    if not force and (ino == _finance_indexed_ino or (
+            _finance_index_attempt is not None and _finance_index_attempt[0] == ino
+            and time.monotonic() - _finance_index_attempt[1] < FINANCE_INDEX_RETRY_INTERVAL)):
+        _finance_index_lock.release()
+        return
+    _finance_index_attempt = (ino, time.monotonic())
+    if force:
+        _run_finance_maintenance(ino)
+        return
+    try:
+        threading.Thread(target=_run_finance_maintenance, args=(ino,),
+                         name="finance-index", daemon=True).start()
+    except RuntimeError as e:   # 解释器退出中等情况起不了线程：本次跳过，下次查询再试
+        _finance_index_lock.release()
+        logger.warning("Finance 索引补建线程启动失败: %s", e)
+
 def get_finance_db():
-    db = getattr(g, '_finance_database', None)
+    """Finance 查询复用线程级长连接（按 inode 识别库文件是否被替换），请求之间不再 connect/close，
+       页缓存和预编译语句跨请求保留。流式响应的游标在生成器结束前由 stream_with_context 保持请求上下文，
+       两种连接方式都能读完；选线程级连接是为了复用，不是为了绕开 teardown。"""
+    try:
+        st = os.stat(FINANCE_DB_PATH)
+    except OSError:
+        return None
+    if st.st_ino != _finance_indexed_ino:
+        ensure_finance_indexes(st.st_ino)
+    # 数据同步可能整体替换 Finance.db，用 inode 识别，避免一直读已被删除的旧文件
+    # WAL 模式在启动时由 init_finance_db 设置（写入库文件后永久生效），这里的只读连接不再尝试
+    # 【性能】Finance.db 只由外部脚本写入，服务端以 mode=ro 打开，SQLite 不再为这条连接准备写路径。
+    # 不加 immutable=1：同步脚本会在运行中写入/替换库文件，immutable 会让连接读到过期页甚至损坏的数据
+    return get_conn(FINANCE_DB_PATH, ident=st.st_ino, read_only=True)
+
+# --- 用户库连接池 ---
+# 【性能】登录/状态/付费每个请求都要用到用户库：连接在进程内有界复用，请求之间不再 connect/close。
+# 不用线程级连接：连接数跟着线程数走、没有上限（gevent 下 threading.local 更是协程级的，每个请求都会新开一条）。
+# 连接按需创建（不在 import 时预建，避免 gunicorn fork 前打开的连接被子进程继承）
+# 池大小 = worker 线程数（gunicorn.conf.py 的 post_fork 把生效的 threads 写进 APP_THREADS），
+# 每个请求线程都能拿到一条连接，不会排队等到 USER_DB_POOL_TIMEOUT 后 500
+USER_DB_POOL_SIZE = max(1, int(os.environ.get('APP_THREADS', '16')))
+USER_DB_POOL_TIMEOUT = 30   # 秒；连接全部被占用时最多等这么久
+_user_db_pool = queue.LifoQueue(maxsize=USER_DB_POOL_SIZE)   # LIFO：优先复用最近用过、页缓存还热的连接
+_user_db_pool_created = 0
+_user_db_pool_lock = threading.Lock()
+
+def _open_user_conn():
+    conn = sqlite3.connect(USER_DB_PATH, timeout=60.0, check_same_thread=False, isolation_level=None,
+                           cached_statements=CONN_CACHED_STATEMENTS)
+    conn.row_factory = sqlite3.Row
+    return _tune_conn(conn)
+
+def _acquire_user_conn():
+    global _user_db_pool_created
+    try:
+        return _user_db_pool.get_nowait()
+    except queue.Empty:
+        pass
+    with _user_db_pool_lock:
+        create = _user_db_pool_created < USER_DB_POOL_SIZE
+        if create:
+            _user_db_pool_created += 1
+    if create:
+        try:
+            return _open_user_conn()
+        except Exception:
+            with _user_db_pool_lock:
+                _user_db_pool_created -= 1
+            raise
+    return _user_db_pool.get(timeout=USER_DB_POOL_TIMEOUT)
+
+def _release_user_conn(conn):
+    # 归还时仍有未提交事务说明中途出错，回滚以免带给下一个使用者
+    if conn.in_transaction:
+        conn.rollback()
+    _user_db_pool.put_nowait(conn)
+
+@contextmanager
+def user_conn():
+    """从连接池借一条用户库连接，with 块结束后归还（不关闭）"""
+    conn = _acquire_user_conn()
+    try:
+        yield conn
+    finally:
+        _release_user_conn(conn)
+
+def get_user_db():
+    """用户库连接：请求内第一次调用时从连接池借出并挂在 g 上复用，请求结束时由 teardown 归还。
+       自动提交模式，多条写入需要原子性的地方自行 BEGIN IMMEDIATE / COMMIT。"""
+    db = getattr(g, '_user_database', None)
     if db is None:
-        if os.path.exists(FINANCE_DB_PATH):
-            db = g._finance_database = sqlite3.connect(FINANCE_DB_PATH, timeout=60.0)
-            db.row_factory = sqlite3.Row
-        else:
-            return None
+        db = g._user_database = _acquire_user_conn()
     return db
 
 @app.teardown_appcontext
 def close_connection(exception):
-    db = getattr(g, '_finance_database', None)
+    db = g.pop('_user_database', None)
     if db is not None:
-        db.close()
+        _release_user_conn(db)
+    # 复用连接不关闭；请求结束时仍有未提交事务说明中途出错，回滚以免带到下一个请求
+    for conn, _ in (getattr(_db_local, 'conns', None) or {}).values():
+        if conn.in_transaction:
+            conn.rollback()
+
+@lru_cache(maxsize=8192)
+def _iso_to_ts(value):
+    """ISO 8601 字符串 -> unix 秒；不带时区的按 UTC 处理（服务器一直用 utcnow 写入）。解析失败返回 None"""
+    if not value:
+        return None
+    text = str(value)
+    if text.endswith('Z'):
+        text = text[:-1] + '+00:00'
+    try:
+        dt = datetime.fromisoformat(text)
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
 
 # --- 用户数据库初始化 (通用) ---
+# users 表结构版本，记录在 PRAGMA user_version 中；新增字段时追加一个迁移函数并把版本号 +1
+USER_DB_SCHEMA_VERSION = 2
+
+def _users_columns(c):
+    return {r[1] for r in c.execute("PRAGMA table_info(users)")}
+
+def _migrate_user_db_v1(c):
+    """v1: 针对已经有旧数据库的老环境，补充 device_id / prediction_* 字段"""
+    existing = _users_columns(c)
+    for col, decl in (('device_id', 'TEXT'),
+                      ('prediction_expire_at', 'TIMESTAMP'),
+                      ('prediction_is_permanent', 'INTEGER DEFAULT 0')):
+        if col not in existing:
+            c.execute(f'ALTER TABLE users ADD COLUMN {col} {decl}')
+
+def _migrate_user_db_v2(c):
+    """
+    v2: 【性能】过期时间另存一份 unix 秒 (*_expire_ts)，状态检查直接比较整数，不再逐次解析 ISO 字符串；
+    *_expire_at 保留原样，仅用于返回给客户端
+    """
+    existing = _users_columns(c)
+    for prefix in SUBSCRIPTION_APP_PREFIXES:
+        if f'{prefix}_expire_ts' not in existing:
+            c.execute(f'ALTER TABLE users ADD COLUMN {prefix}_expire_ts INTEGER')
+        # 回填老数据
+        rows = c.execute(f"""SELECT id, {prefix}_expire_at FROM users
+                             WHERE {prefix}_expire_at IS NOT NULL AND {prefix}_expire_ts IS NULL""").fetchall()
+        c.executemany(f"UPDATE users SET {prefix}_expire_ts = ? WHERE id = ?",
+                      [(_iso_to_ts(expire_at), row_id) for row_id, expire_at in rows])
+
+_USER_DB_MIGRATIONS = (
+    (1, _migrate_user_db_v1),
+    (2, _migrate_user_db_v2),
+)
+
 def init_user_db():
-    print(f"检查用户数据库: {USER_DB_PATH}")
+    logger.info("检查用户数据库: %s", USER_DB_PATH)
     # 确保存储目录存在
     os.makedirs(os.path.dirname(USER_DB_PATH), exist_ok=True)
-    conn = sqlite3.connect(USER_DB_PATH, timeout=60.0)
+    conn = sqlite3.connect(USER_DB_PATH, timeout=60.0, isolation_level=None)
     c = conn.cursor()
     # 【关键修复】同样开启 WAL，避免额度/登录写入阻塞读取
     c.execute("PRAGMA journal_mode=WAL")
-    c.execute("PRAGMA synchronous=NORMAL")
-    
-    # 【核心修改】新的表结构, ，添加了 device_id
-    # finance_expire_at: Finance 付费过期时间
-    # finance_is_permanent: Finance 永久/亲友 VIP 标记 (0或1)
-    # onews_expire_at: ONews 付费过期时间
-    # onews_is_permanent: ONews 永久/亲友 VIP 标记 (0或1)
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            apple_user_id TEXT NOT NULL UNIQUE,
-            device_id TEXT,
-            created_at TIMESTAMP NOT NULL,
-            last_login_at TIMESTAMP,
+    _tune_conn(conn)
+
+    # 【关键】建表 + 迁移放在同一个 BEGIN IMMEDIATE 事务里：多个 worker 同时启动时只有一个拿到写锁，
+    # 其余的等它提交后读到新的 user_version，直接跳过迁移，不会再撞上 "duplicate column" 之类的竞争
+    c.execute("BEGIN IMMEDIATE")
+    try:
+        # 【核心修改】新的表结构, ，添加了 device_id
+        # finance_expire_at: Finance 付费过期时间
+        # finance_is_permanent: Finance 永久/亲友 VIP 标记 (0或1)
+        # onews_expire_at: ONews 付费过期时间
+        # onews_is_permanent: ONews 永久/亲友 VIP 标记 (0或1)
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                apple_user_id TEXT NOT NULL UNIQUE,
+                device_id TEXT,
+                created_at TIMESTAMP NOT NULL,
+                last_login_at TIMESTAMP,
             
-            finance_expire_at TIMESTAMP,
-            finance_is_permanent INTEGER DEFAULT 0,
+                finance_expire_at TIMESTAMP,
+                finance_is_permanent INTEGER DEFAULT 0,
             
-            onews_expire_at TIMESTAMP,
-            onews_is_permanent INTEGER DEFAULT 0,
+                onews_expire_at TIMESTAMP,
+                onews_is_permanent INTEGER DEFAULT 0,
             
-            prediction_expire_at TIMESTAMP,
-            prediction_is_permanent INTEGER DEFAULT 0
-        )
-    ''')
-    
-    # 2. 数据库升级逻辑：针对已经有旧数据库，需要补充新字段的老环境
-    # 尝试添加 device_id 列
-    try:
-        c.execute('ALTER TABLE users ADD COLUMN device_id TEXT')
-    except sqlite3.OperationalError:
-        pass 
+                prediction_expire_at TIMESTAMP,
+                prediction_is_permanent INTEGER DEFAULT 0,
 
-    # 尝试添加 prediction_expire_at 列
-    try:
-        c.execute('ALTER TABLE users ADD COLUMN prediction_expire_at TIMESTAMP')
-    except sqlite3.OperationalError:
-        # 如果捕获到 OperationalError，说明这列已经存在了，直接跳过即可
-        pass 
+                finance_expire_ts INTEGER,
+                onews_expire_ts INTEGER,
+                prediction_expire_ts INTEGER
+            )
+        ''')
 
-    # 尝试添加 prediction_is_permanent 列
-    try:
-        c.execute('ALTER TABLE users ADD COLUMN prediction_is_permanent INTEGER DEFAULT 0')
-    except sqlite3.OperationalError:
-        pass
+        # 2. 数据库升级逻辑：按 user_version 只执行尚未跑过的迁移
+        version = c.execute("PRAGMA user_version").fetchone()[0]
+        for target, migrate in _USER_DB_MIGRATIONS:
+            if version < target:
+                migrate(c)
+        if version < USER_DB_SCHEMA_VERSION:
+            c.execute(f"PRAGMA user_version = {USER_DB_SCHEMA_VERSION}")
 
-    # 【新增】Finance 点数账本（服务器权威，绑定 Apple ID）
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS finance_points (
-            user_id TEXT PRIMARY KEY,
-            invite_code TEXT UNIQUE,
-            bonus_remaining INTEGER DEFAULT 0,
-            bonus_total INTEGER DEFAULT 0,
-            daily_used INTEGER DEFAULT 0,
-            last_date TEXT,
-            invited_by_code TEXT,
-            invite_reward_count INTEGER DEFAULT 0,
-            created_at TIMESTAMP
-        )
-    ''')
-    # 【新增】Finance 当日已解锁项（同一项当天再次访问免费，与旧客户端逻辑一致）
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS finance_daily_unlocks (
-            user_id TEXT NOT NULL,
-            item_key TEXT NOT NULL,
-            unlock_date TEXT NOT NULL,
-            created_at TIMESTAMP,
-            PRIMARY KEY (user_id, item_key, unlock_date)
-        )
-    ''')
-    c.execute('CREATE INDEX IF NOT EXISTS idx_fin_unlock ON finance_daily_unlocks(user_id, unlock_date)')
+        # 【新增】Finance 点数账本（服务器权威，绑定 Apple ID）
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS finance_points (
+                user_id TEXT PRIMARY KEY,
+                invite_code TEXT UNIQUE,
+                bonus_remaining INTEGER DEFAULT 0,
+                bonus_total INTEGER DEFAULT 0,
+                daily_used INTEGER DEFAULT 0,
+                last_date TEXT,
+                invited_by_code TEXT,
+                invite_reward_count INTEGER DEFAULT 0,
+                created_at TIMESTAMP
+            )
+        ''')
+        # 【新增】Finance 当日已解锁项（同一项当天再次访问免费，与旧客户端逻辑一致）
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS finance_daily_unlocks (
+                user_id TEXT NOT NULL,
+                item_key TEXT NOT NULL,
+                unlock_date TEXT NOT NULL,
+                created_at TIMESTAMP,
+                PRIMARY KEY (user_id, item_key, unlock_date)
+            )
+        ''')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_fin_unlock ON finance_daily_unlocks(user_id, unlock_date)')
 
-    conn.commit()
-    conn.close()
-    print("用户数据库已准备就绪。")
+
+        c.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction:
+            c.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    logger.info("用户数据库已准备就绪。")
+
+# --- Finance 数据库索引初始化 ---
+def init_finance_db():
+    """启动时检查一次 Finance.db 的 WAL/索引；运行中库文件被替换后由 get_finance_db 再次触发。
+       users.apple_user_id 已有 UNIQUE 约束自带的索引，无需另建。"""
+    if not os.path.exists(FINANCE_DB_PATH):
+        logger.info("未找到 Finance 数据库，跳过索引检查: %s", FINANCE_DB_PATH)
+        return
+    # 记下本进程已处理过的 inode（gunicorn 下 init 在独立子进程里跑，worker 首次查询时会在后台线程再确认一次，均为 IF NOT EXISTS 的空操作）
+    ensure_finance_indexes(os.stat(FINANCE_DB_PATH).st_ino, force=True)
+
+def _maintain_finance_db():
+    """Finance.db 由外部脚本写入，这里只补充查询所需的索引（IF NOT EXISTS，可重复执行），
+       并切到 WAL（请求期间的连接是只读的，这里单独开一条读写连接）。成功返回 True"""
+    conn = sqlite3.connect(FINANCE_DB_PATH, timeout=FINANCE_INDEX_BUSY_TIMEOUT)
+    try:
+        c = conn.cursor()
+        # WAL 写入库文件后永久生效：读请求不再和导入脚本的写入互相阻塞
+        c.execute("PRAGMA journal_mode=WAL")
+        tables = [r[0] for r in c.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'")]
+        # 各行情表 / Earning / Options 都是 WHERE name = ? 再按 date 过滤排序
+        # (historical 的 BETWEEN + ORDER BY、latest_volume 的 ORDER BY date DESC LIMIT 1、closing_price 的等值查询)，
+        # 凡是同时有 name、date 列的表都建 (name, date) 复合索引，直接按索引顺序取，不再全表扫描 + 排序。
+        # 【性能】有 price 列时把 price 也放进索引（SQLite 没有 INCLUDE，用追加键列模拟）成为覆盖索引：
+        # closing_price、Earning 以及只有 date/price 的行情表整条查询只读索引 B 树，不再回表。
+        # 有 volume 列的行情表再追加 volume：latest_volume 的 ORDER BY date DESC LIMIT 1 倒序扫索引、
+        # 一次定位即得结果（SQLite 可反向遍历索引，无需声明 DESC）；只有 volume 可选列的表 historical 也全覆盖。
+        # 较长的索引前缀已能覆盖较短索引的所有用途，较短的旧索引删除，免得导入时多维护一份
+        for table in tables:
+            columns = {r[1].lower() for r in c.execute(f'PRAGMA table_info("{table}")')}
+            if not {'name', 'date'} <= columns:
+                continue
+            index_columns = ['name', 'date']
+            if 'price' in columns:
+                index_columns.append('price')
+                if 'volume' in columns:
+                    index_columns.append('volume')
+            index_name = f'"idx_{table.lower()}_{"_".join(index_columns)}"'
+            c.execute(f'CREATE INDEX IF NOT EXISTS {index_name} ON "{table}"({", ".join(index_columns)})')
+            for n in range(2, len(index_columns)):
+                c.execute(f'DROP INDEX IF EXISTS "idx_{table.lower()}_{"_".join(index_columns[:n])}"')
+        if 'Options' in tables:
+            # options_rank 按 date 取最新两天，并按 (name, date) 关联前一天
+            c.execute('CREATE INDEX IF NOT EXISTS idx_options_date ON "Options"(date)')
+        if 'MNSPP' in tables:
+            # options_rank 以 MNSPP.symbol 关联市值
+            c.execute('CREATE INDEX IF NOT EXISTS idx_mnspp_symbol ON "MNSPP"(symbol)')
+        conn.commit()
+        # 从未收集过统计信息时跑一次 ANALYZE，让查询规划器知道这些索引的选择性；
+        # 之后不再重复（大库上 ANALYZE 要扫全表）
+        if c.execute("SELECT 1 FROM sqlite_master WHERE name='sqlite_stat1'").fetchone() is None:
+            c.execute("ANALYZE")
+            conn.commit()
+        logger.info("Finance 数据库索引已就绪。")
+        return True
+    except sqlite3.Error as e:
+        logger.error("Finance 数据库索引创建失败: %s", e)
+        return False
+    finally:
+        conn.close()
 
 def get_video_quota_config():
     """返回 (每日免费次数, 首次登录一次性赠送次数)。enabled=false 时都为 0。"""
     version_file_path = os.path.join(BASE_RESOURCES_DIR, 'ONews', 'version.json')
     try:
-        with open(version_file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            q = data.get('video_free_quota', {}) or {}
-            if not q.get('enabled', False):
-                return 0, 0
-            return int(q.get('daily_count', 0)), int(q.get('first_login_bonus', 0))
+        data = load_version_data(version_file_path)
+        q = data.get('video_free_quota', {}) or {}
+        if not q.get('enabled', False):
+            return 0, 0
+        return int(q.get('daily_count', 0)), int(q.get('first_login_bonus', 0))
     except Exception as e:
-        print(f"读取免费次数配置失败: {e}")
+        logger.warning("读取免费次数配置失败: %s", e)
         return 0, 0
 
 def get_video_free_quota():
@@ -368,8 +723,7 @@ def get_video_free_quota():
 def get_video_points_config():
     version_file = os.path.join(BASE_RESOURCES_DIR, 'ONews', 'version.json')
     try:
-        with open(version_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        data = load_version_data(version_file)
         q = data.get('video_free_quota', {}) or {}
         enabled = bool(q.get('enabled', False))
         return {
@@ -378,14 +732,13 @@ def get_video_points_config():
             'invite_reward_points': int(data.get('video_invite_reward_points', 8)),
         }
     except Exception as e:
-        print(f"读取视频点数配置失败: {e}")
+        logger.warning("读取视频点数配置失败: %s", e)
         return {'daily_quota': 0, 'first_login_bonus': 0, 'invite_reward_points': 8}
 
 def get_news_points_config():
     version_file = os.path.join(BASE_RESOURCES_DIR, 'ONews', 'version.json')
     try:
-        with open(version_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        data = load_version_data(version_file)
         q = data.get('news_free_quota', {}) or {}
         enabled = bool(q.get('enabled', True))
         return {
@@ -394,7 +747,7 @@ def get_news_points_config():
             'invite_reward_points': int(data.get('news_invite_reward_points', 28)),
         }
     except Exception as e:
-        print(f"读取新闻点数配置失败: {e}")
+        logger.warning("读取新闻点数配置失败: %s", e)
         return {'daily_quota': 5, 'first_login_bonus': 18, 'invite_reward_points': 28}
 
 def _gen_points_code(cursor, table, length=6):
@@ -462,10 +815,38 @@ def _log_onews_invite(inviter_id, code, invitee_id, points):
             VALUES (?,?,?,?,?)''', (inviter_id, code, invitee_id, points, now_iso()))
         conn.commit(); conn.close()
     except Exception as e:
-        print(f"记录ONews邀请日志失败: {e}")
+        logger.warning("记录ONews邀请日志失败: %s", e)
     
+# 行为库结构版本，同样记录在 PRAGMA user_version 中
+ANALYTICS_DB_SCHEMA_VERSION = 1
+
+def _migrate_analytics_db_v1(c):
+    """v1: 老库补字段（原先每次启动都逐条 ALTER TABLE 再吞掉 duplicate column 异常）"""
+    for table, col, decl in (
+        # 解锁记录标注来源：bonus=一次性赠送 / daily=每日免费（老库默认 daily）
+        ('video_free_unlocks', 'source', "TEXT DEFAULT 'daily'"),
+        # 举报表的回复字段
+        ('video_link_reports', 'admin_reply', 'TEXT'),
+        ('video_link_reports', 'reply_status', "TEXT DEFAULT 'none'"),
+        ('video_link_reports', 'replied_at', 'TIMESTAMP'),
+        # 视频统计表的 user_type；视频流水表的 source（播放来源；仅在线播放有值）
+        ('event_logs', 'user_type', "TEXT DEFAULT 'apple'"),
+        ('user_video_events', 'user_type', "TEXT DEFAULT 'apple'"),
+        ('event_logs', 'source', 'TEXT'),
+        # 【需求4】三张流水表的 app_version
+        ('event_logs', 'app_version', 'TEXT'),
+        ('news_event_logs', 'app_version', 'TEXT'),
+        ('finance_event_logs', 'app_version', 'TEXT'),
+    ):
+        if col not in {r[1] for r in c.execute(f"PRAGMA table_info({table})")}:
+            c.execute(f'ALTER TABLE {table} ADD COLUMN {col} {decl}')
+
+_ANALYTICS_DB_MIGRATIONS = (
+    (1, _migrate_analytics_db_v1),
+)
+
 def init_analytics_db():
-    print(f"检查行为数据库: {ANALYTICS_DB_PATH}")
+    logger.info("检查行为数据库: %s", ANALYTICS_DB_PATH)
     conn = sqlite3.connect(ANALYTICS_DB_PATH, timeout=60.0)
     c = conn.cursor()
     # 【关键修复】开启 WAL：读写互不阻塞，彻底解决“活跃用户榜”被客户端写入拖死的问题
@@ -555,23 +936,6 @@ def init_analytics_db():
             granted_at TIMESTAMP NOT NULL
         )
     ''')
-    # 【新增】解锁记录标注来源：bonus=一次性赠送 / daily=每日免费（老库默认 daily）
-    try:
-        c.execute("ALTER TABLE video_free_unlocks ADD COLUMN source TEXT DEFAULT 'daily'")
-    except sqlite3.OperationalError:
-        pass
-    
-    # 【新增】给举报表补充回复字段（兼容老库）
-    for ddl in [
-        "ALTER TABLE video_link_reports ADD COLUMN admin_reply TEXT",
-        "ALTER TABLE video_link_reports ADD COLUMN reply_status TEXT DEFAULT 'none'",
-        "ALTER TABLE video_link_reports ADD COLUMN replied_at TIMESTAMP",
-    ]:
-        try:
-            c.execute(ddl)
-        except sqlite3.OperationalError:
-            pass
-        
     #【新增】错误链接举报表（补充回复字段，与 wish 一致）
     c.execute('''
         CREATE TABLE IF NOT EXISTS video_link_reports (
@@ -598,22 +962,6 @@ def init_analytics_db():
     ''')
     c.execute('CREATE INDEX IF NOT EXISTS idx_reports_status ON video_link_reports(status)')
     c.execute('CREATE INDEX IF NOT EXISTS idx_reports_ep ON video_link_reports(episode_url)')
-    c.execute('CREATE INDEX IF NOT EXISTS idx_reports_reply ON video_link_reports(user_id, reply_status)')
-
-    # 【新增】给视频统计表补充 user_type 字段（兼容老库）
-    try:
-        c.execute("ALTER TABLE event_logs ADD COLUMN user_type TEXT DEFAULT 'apple'")
-    except sqlite3.OperationalError:
-        pass
-    try:
-        c.execute("ALTER TABLE user_video_events ADD COLUMN user_type TEXT DEFAULT 'apple'")
-    except sqlite3.OperationalError:
-        pass
-    # 【新增】给视频流水表补充 source 字段（播放来源；仅在线播放有值）
-    try:
-        c.execute("ALTER TABLE event_logs ADD COLUMN source TEXT")
-    except sqlite3.OperationalError:
-        pass
     
     # 【新增】用户寻片/许愿请求表（含第二阶段的管理员回复字段）
     c.execute('''
@@ -736,12 +1084,18 @@ def init_analytics_db():
             )
         ''')
 
-    # 【需求4】给三张流水表补充 app_version（兼容老库）
-    for tbl in ('event_logs', 'news_event_logs', 'finance_event_logs'):
-        try:
-            c.execute(f"ALTER TABLE {tbl} ADD COLUMN app_version TEXT")
-        except sqlite3.OperationalError:
-            pass
+    # 老库补字段：按 user_version 只执行尚未跑过的迁移，不再每次启动都逐条 ALTER TABLE 试错
+    c.execute("BEGIN IMMEDIATE")
+    version = c.execute("PRAGMA user_version").fetchone()[0]
+    for target, migrate in _ANALYTICS_DB_MIGRATIONS:
+        if version < target:
+            migrate(c)
+    if version < ANALYTICS_DB_SCHEMA_VERSION:
+        c.execute(f"PRAGMA user_version = {ANALYTICS_DB_SCHEMA_VERSION}")
+    conn.commit()
+
+    # 依赖 v1 补上的 reply_status 字段，须放在迁移之后
+    c.execute('CREATE INDEX IF NOT EXISTS idx_reports_reply ON video_link_reports(user_id, reply_status)')
 
     # 【新增】活跃用户榜是按 user_id 全表分组，加索引避免临时排序、加快聚合
     c.execute('CREATE INDEX IF NOT EXISTS idx_logs_user ON event_logs(user_id)')
@@ -750,7 +1104,7 @@ def init_analytics_db():
 
     conn.commit()
     conn.close()
-    print("行为数据库已就绪。")
+    logger.info("行为数据库已就绪。")
 
 
 # OVideo 视频模块 API
@@ -913,7 +1267,7 @@ def _get_valid_urls():
             _url_mapping_cache['valid'] = set(mappings.keys())
             _url_mapping_cache['mtime'] = m
         except Exception as e:
-            print(f"url_mapping 读取失败: {e}")
+            logger.warning("url_mapping 读取失败: %s", e)
     return _url_mapping_cache['valid']
 
 def build_video_db():
@@ -921,7 +1275,7 @@ def build_video_db():
     video_file = os.path.join(OVIDEO_DIR, 'OVideos.json')
     if not os.path.exists(video_file):
         return
-    print("[OVideo] 开始构建 SQLite ...")
+    logger.info("[OVideo] 开始构建 SQLite ...")
     with open(video_file, 'r', encoding='utf-8') as f:
         data = json.load(f)
 
@@ -933,7 +1287,7 @@ def build_video_db():
             with open(blacklist_file, 'r', encoding='utf-8') as bf:
                 blacklist_set = set(json.load(bf).keys())
         except Exception as e:
-            print(f"[OVideo] 黑名单读取失败: {e}")
+            logger.warning("[OVideo] 黑名单读取失败: %s", e)
 
     # ⭐ 新增：读取 url_mapping 的有效 key 集合（Drama/Anime 隐藏判定需要）
     mapping_file = os.path.join(OVIDEO_DIR, 'url_mapping.json')
@@ -943,7 +1297,7 @@ def build_video_db():
             with open(mapping_file, 'r', encoding='utf-8') as mf:
                 valid_url_set = set(json.load(mf).keys())
         except Exception as e:
-            print(f"[OVideo] url_mapping 读取失败: {e}")
+            logger.warning("[OVideo] url_mapping 读取失败: %s", e)
 
     conn = sqlite3.connect(OVIDEO_DB_PATH, timeout=60.0)
     c = conn.cursor()
@@ -1059,7 +1413,7 @@ def build_video_db():
               (json.dumps(cat_order, ensure_ascii=False),))
     conn.commit()
     conn.close()
-    print(f"[OVideo] 构建完成，共 {len(rows)} 条。")
+    logger.info("[OVideo] 构建完成，共 %s 条。", len(rows))
 
 def ensure_video_db():
     """JSON / 黑名单 / url_mapping 变更时自动重建（加锁，避免并发重复构建）"""
@@ -1118,11 +1472,8 @@ def _is_vip_permanent(user_id):
     if not user_id:
         return False
     try:
-        conn = sqlite3.connect(USER_DB_PATH, timeout=10.0)
-        conn.row_factory = sqlite3.Row
-        row = conn.execute("""SELECT onews_is_permanent, finance_is_permanent, prediction_is_permanent
-                              FROM users WHERE apple_user_id=?""", (user_id,)).fetchone()
-        conn.close()
+        row = get_user_db().execute("""SELECT onews_is_permanent, finance_is_permanent, prediction_is_permanent
+                                       FROM users WHERE apple_user_id=?""", (user_id,)).fetchone()
         return bool(row and (row['onews_is_permanent'] == 1
                              or row['finance_is_permanent'] == 1
                              or row['prediction_is_permanent'] == 1))
@@ -1136,8 +1487,7 @@ def _get_block_config(user_id):
     version_file = os.path.join(BASE_RESOURCES_DIR, 'ONews', 'version.json')
     if os.path.exists(version_file):
         try:
-            with open(version_file, 'r', encoding='utf-8') as vf:
-                vdata = json.load(vf)
+            vdata = load_version_data(version_file)
             rf = vdata.get('video_region_filter', {}) or {}
             rf_on = bool(rf.get('enabled', False))
             region_kw = [k for k in rf.get('keywords', []) if k]
@@ -1145,7 +1495,7 @@ def _get_block_config(user_id):
             tf_on = bool(tf.get('enabled', False))
             type_kw = [k for k in tf.get('keywords', []) if k]
         except Exception as e:
-            print(f"屏蔽配置读取失败: {e}")
+            logger.warning("屏蔽配置读取失败: %s", e)
     if _is_vip_permanent(user_id):
         return [], []
     return (region_kw if rf_on else []), (type_kw if tf_on else [])
@@ -1184,30 +1534,27 @@ def get_ovideos():
         version_file_path = os.path.join(BASE_RESOURCES_DIR, 'ONews', 'version.json')
         if os.path.exists(version_file_path):
             try:
-                with open(version_file_path, 'r', encoding='utf-8') as vf:
-                    vdata = json.load(vf)
-                    # 地区屏蔽
-                    rf = vdata.get('video_region_filter', {}) or {}
-                    region_filter_enabled = bool(rf.get('enabled', False))
-                    region_keywords = [k for k in rf.get('keywords', []) if k]
-                    # 类型屏蔽
-                    tf = vdata.get('video_type_filter', {}) or {}
-                    type_filter_enabled = bool(tf.get('enabled', False))
-                    type_keywords = [k for k in tf.get('keywords', []) if k]
+                vdata = load_version_data(version_file_path)
+                # 地区屏蔽
+                rf = vdata.get('video_region_filter', {}) or {}
+                region_filter_enabled = bool(rf.get('enabled', False))
+                region_keywords = [k for k in rf.get('keywords', []) if k]
+                # 类型屏蔽
+                tf = vdata.get('video_type_filter', {}) or {}
+                type_filter_enabled = bool(tf.get('enabled', False))
+                type_keywords = [k for k in tf.get('keywords', []) if k]
             except Exception as e:
-                print(f"读取屏蔽配置失败: {e}")
+                logger.warning("读取屏蔽配置失败: %s", e)
 
         # 针对 redeem_invite 永久 VIP 用户：强制关闭过滤
         user_id = request.args.get('user_id')
         # 【新增】黑名单用户直接返回空,数据层兜底
         if user_id and user_id in VIDEO_MODULE_BLOCKED_USERS:
-            print(f"[OVideo] 用户 {user_id} 在视频黑名单中,返回空列表")
+            logger.debug("[OVideo] 用户 %s 在视频黑名单中,返回空列表", user_id)
             return jsonify({"categories": []})
         if user_id:
             try:
-                conn = sqlite3.connect(USER_DB_PATH, timeout=10.0)
-                conn.row_factory = sqlite3.Row
-                c = conn.cursor()
+                c = get_user_db().cursor()
                 # 检查该用户是否在任意应用中拥有永久 VIP（is_permanent == 1）
                 c.execute("""
                     SELECT onews_is_permanent, finance_is_permanent, prediction_is_permanent 
@@ -1219,12 +1566,11 @@ def get_ovideos():
                     row['finance_is_permanent'] == 1,
                     row['prediction_is_permanent'] == 1
                 ]):
-                    print(f"[OVideo] 用户 {user_id} 是永久 VIP(redeem)，跳过地区/类型过滤")
+                    logger.debug("[OVideo] 用户 %s 是永久 VIP(redeem)，跳过地区/类型过滤", user_id)
                     region_filter_enabled = False
                     type_filter_enabled = False
-                conn.close()
             except Exception as e:
-                print(f"[OVideo] 查询用户VIP状态失败: {e}")
+                logger.warning("[OVideo] 查询用户VIP状态失败: %s", e)
 
         def is_region_blocked(item):
             if not region_filter_enabled or not region_keywords:
@@ -1297,7 +1643,7 @@ def get_ovideos():
 
         return jsonify({"categories": categories})
     except Exception as e:
-        traceback.print_exc()
+        logger.exception("请求处理失败: %s", request.path)
         return jsonify({"error": str(e)}), 500
     
 @app.route('/api/OVideo/playlist', methods=['GET'])
@@ -1367,7 +1713,7 @@ def resolve_ovideo_url():
             if episode_url in blacklist:
                 return jsonify({"error": "Blacklisted", "reason": "该视频暂不可用"}), 403
         except Exception as e:
-            print(f"黑名单读取失败: {e}")
+            logger.warning("黑名单读取失败: %s", e)
 
     # 映射表
     mapping_file = os.path.join(OVIDEO_DIR, 'url_mapping.json')
@@ -1887,7 +2233,7 @@ def report_video_link():
         conn.close()
         return jsonify({"status": "ok"}), 200
     except Exception as e:
-        traceback.print_exc()
+        logger.exception("请求处理失败: %s", request.path)
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/OVideo/wish', methods=['POST'])
@@ -1926,7 +2272,7 @@ def submit_video_wish():
         conn.close()
         return jsonify({"status": "ok"}), 200
     except Exception as e:
-        traceback.print_exc()
+        logger.exception("请求处理失败: %s", request.path)
         return jsonify({"error": str(e)}), 500
 
 
@@ -2039,7 +2385,7 @@ def track_event():
         conn.close()
         return jsonify({"status": "ok"}), 200
     except Exception as e:
-        traceback.print_exc()
+        logger.exception("请求处理失败: %s", request.path)
         return jsonify({"error": str(e)}), 500
     
 # 视频 - 某个用户的详细观看/下载历史
@@ -2349,7 +2695,7 @@ def video_quota_unlock():
     except Exception as e:
         try: c.execute("ROLLBACK")
         except Exception: pass
-        traceback.print_exc()
+        logger.exception("请求处理失败: %s", request.path)
         return jsonify({"error": str(e)}), 500
     finally:
         conn.close()
@@ -2357,7 +2703,6 @@ def video_quota_unlock():
 # --- ONews API 路由 ---
 @app.route('/api/<app_name>/check_version', methods=['GET'])
 def check_version(app_name):
-    print(f"收到来自应用 '{app_name}' 的版本检查请求")
     if app_name not in ALLOWED_APPS:
         return jsonify({"error": "无效的应用名称"}), 404
     
@@ -2367,17 +2712,28 @@ def check_version(app_name):
     
     # 获取原始的 version.json 内容
     version_file_path = os.path.join(BASE_RESOURCES_DIR, app_name, 'version.json')
-    if os.path.exists(version_file_path):
-        with open(version_file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
+    loaded = _load_version_json(version_file_path)
+    if loaded is None:
+        return jsonify({"error": "Version file not found"}), 404
+    file_key, cached = loaded
+    free_day = is_free_access_day()
+
+    # 【性能】ETag = 文件 mtime/size + 注入的动态字段；客户端带 If-None-Match 命中时直接 304，
+    # 既不重新序列化也不回传正文。用弱 ETag：gzip 与否不影响命中（Compress 不改写弱 ETag）
+    etag = f"{app_name}-{file_key[0]}-{file_key[1]}-{server_date_str}-{int(free_day)}"
+    if request.if_none_match.contains_weak(etag):
+        resp = app.response_class(status=304)
+    else:
+        data = dict(cached)
         # 【关键】动态注入服务器当前日期
         data['server_date'] = server_date_str
         # 【新增】服务器权威判断的免点数日标志，防止客户端改设备日期白嫖
-        data['is_free_access_day'] = is_free_access_day()
-        return jsonify(data)
-    else:
-        return jsonify({"error": "Version file not found"}), 404
+        data['is_free_access_day'] = free_day
+        resp = ojsonify(data)
+    resp.set_etag(etag, weak=True)
+    resp.cache_control.max_age = VERSION_JSON_MAX_AGE
+    resp.cache_control.must_revalidate = True
+    return resp
 
 # --- 在 AppServer.py 中添加删除账号路由 ---
 @app.route('/api/<app_name>/user/delete', methods=['POST'])
@@ -2388,27 +2744,59 @@ def delete_user(app_name):
     if not user_id: 
         return jsonify({"error": "Missing user_id"}), 400
         
-    conn = sqlite3.connect(USER_DB_PATH, timeout=60.0)
-    c = conn.cursor()
+    c = get_user_db().cursor()
     try:
-        # 从数据库中永久删除该用户
+        # 从数据库中永久删除该用户（单条语句，自动提交）
         c.execute("DELETE FROM users WHERE apple_user_id = ?", (user_id,))
         if c.rowcount == 0:
             return jsonify({"error": "User not found"}), 404
-        conn.commit()
-        print(f"[{app_name}] 用户 {user_id} 已成功删除账号。")
+        status_cache_invalidate(user_id)
+        logger.info("[%s] 用户 %s 已成功删除账号。", app_name, user_id)
         return jsonify({"status": "success"}), 200
     except Exception as e:
-        print(f"删除账号失败: {e}")
+        logger.error("删除账号失败: %s", e)
         return jsonify({"error": str(e)}), 500
-    finally:
-        conn.close()
+
+def _x_accel_response(full_path, file):
+    """返回只有响应头的 X-Accel-Redirect 响应，由 nginx 从内部 location 读取并发送文件"""
+    rel_path = os.path.relpath(full_path, BASE_RESOURCES_DIR).replace(os.sep, '/')
+    resp = app.response_class(mimetype=mimetypes.guess_type(file)[0] or 'application/octet-stream')
+    resp.headers['X-Accel-Redirect'] = f"{X_ACCEL_REDIRECT_PREFIX}/{quote(rel_path)}"
+    try:
+        file.encode('ascii')
+        resp.headers['Content-Disposition'] = f'attachment; filename="{file}"'
+    except UnicodeEncodeError:
+        resp.headers['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(file)}"
+    return resp
+
+DOWNLOAD_PATH_CACHE_TTL = 60  # 秒；新上传/删除的文件最多晚 1 分钟被下载接口感知
+
+# 下载的客户端缓存时间：图片基本不改，缓存一天；json 等数据文件会原名覆盖更新，只缓存 1 分钟。
+# 两者都带 ETag/Last-Modified（send_from_directory 自带），过期后凭条件请求拿 304。
+# 不加 immutable：文件名会被复用，需要保留重新验证的机会
+DOWNLOAD_IMAGE_EXTS = frozenset({'.jpg', '.jpeg', '.png', '.webp', '.gif', '.heic'})
+DOWNLOAD_IMAGE_MAX_AGE = 86400
+DOWNLOAD_DEFAULT_MAX_AGE = 60
+
+def _download_max_age(file):
+    return DOWNLOAD_IMAGE_MAX_AGE if os.path.splitext(file)[1].lower() in DOWNLOAD_IMAGE_EXTS else DOWNLOAD_DEFAULT_MAX_AGE
+
+@lru_cache(maxsize=4096)
+def _resolve_download_path(app_name, filename, _time_bucket):
+    """
+    【性能】缓存 safe_join + isfile 的结果，热门文件重复下载不再每次都做路径规范化和 stat。
+    _time_bucket = int(time.time() // DOWNLOAD_PATH_CACHE_TTL)，只参与缓存键，起 TTL 作用。
+    返回 (full_path, is_file)；路径不安全时 full_path 为 None。
+    """
+    full_path = safe_join(BASE_RESOURCES_DIR, app_name, filename)
+    if full_path is None:
+        return None, False
+    return full_path, os.path.isfile(full_path)
 
 @app.route('/api/<app_name>/download', methods=['GET'])
 def download_file(app_name):
     # filename 参数现在可能是 "some.json" 或 "some_dir/some_image.jpg"
     filename = request.args.get('filename')
-    print(f"收到来自应用 '{app_name}' 的文件下载请求: {filename}")
 
     if app_name not in ALLOWED_APPS:
         return jsonify({"error": "无效的应用名称"}), 404
@@ -2417,28 +2805,128 @@ def download_file(app_name):
 
     # --- 核心修改：使用 werkzeug.utils.safe_join 来构建安全路径 ---
     # safe_join 是 Flask/Werkzeug 推荐的、更安全的方式来防止目录遍历攻击
-    try:
-        # safe_join 会自动处理路径规范化和安全检查
-        full_path = safe_join(BASE_RESOURCES_DIR, app_name, filename)
-    except Exception:
-        # 如果路径包含 '..' 或其他不安全部分，safe_join 会抛出异常
-        print(f"错误: 请求的路径不安全: {filename}")
+    # safe_join 会自动处理路径规范化和安全检查；路径包含 '..' 或其他不安全部分时返回 None
+    full_path, is_file = _resolve_download_path(app_name, filename, int(time.time() // DOWNLOAD_PATH_CACHE_TTL))
+    if full_path is None:
+        logger.warning("错误: 请求的路径不安全: %s", filename)
         return jsonify({"error": "无效的路径"}), 400
         
-    if not os.path.isfile(full_path):
-        print(f"错误: 请求的文件不存在: {full_path}")
+    if not is_file:
+        logger.debug("错误: 请求的文件不存在: %s", full_path)
         return jsonify({"error": "文件未找到"}), 404
 
     try:
         # send_from_directory 需要目录和文件名作为分离的参数
         directory, file = os.path.split(full_path)
-        print(f"正在发送文件 '{file}' 从目录 '{directory}'")
-        return send_from_directory(directory, file, as_attachment=True)
+        max_age = _download_max_age(file)
+        if X_ACCEL_REDIRECT_PREFIX:
+            # 【性能】交给 nginx 发送文件本体，worker 发完响应头即可去处理下一个请求
+            resp = _x_accel_response(full_path, file)
+            resp.cache_control.public = True
+            resp.cache_control.max_age = max_age
+            return resp
+        # conditional=True（默认）：If-None-Match / If-Modified-Since 命中时直接 304，不读文件
+        return send_from_directory(directory, file, as_attachment=True, max_age=max_age)
+    except NotFound:
+        # 缓存窗口内文件已被删除/改名：isfile 结果过期，清掉缓存让下次请求重新 stat
+        _resolve_download_path.cache_clear()
+        logger.debug("错误: 请求的文件已不存在: %s", full_path)
+        return jsonify({"error": "文件未找到"}), 404
     except Exception as e:
-        print(f"发生错误: {e}")
+        logger.error("发生错误: %s", e)
         return jsonify({"error": str(e)}), 500
 
+# --- /user/status 结果缓存 ---
+# 订阅状态只在付费/兑换/删号时变化，轮询接口先查内存；这些写操作负责失效对应用户
+STATUS_CACHE_TTL = 60        # 秒；兜底保证过期的订阅最多晚 1 分钟反映出来
+STATUS_CACHE_MAX = 10000
+_status_cache = {}           # (app_name, user_id) -> (过期时间戳, 响应 dict)
+# 【关键】防止读到旧行的状态查询在付费/兑换失效缓存之后再把旧结果写回去：
+# 读库前先取用户的代数，写回时代数没变才接受；失效时代数 +1。status_cache_clear 整体换 epoch
+_status_cache_gen = {}       # user_id -> 失效次数
+_status_cache_epoch = 0
+_status_cache_lock = threading.Lock()
+
+def status_cache_get(app_name, user_id):
+    entry = _status_cache.get((app_name, user_id))
+    if entry is None or entry[0] < time.time():
+        return None
+    return entry[1]
+
+def status_cache_generation(user_id):
+    """读库之前调用，结果原样传给 status_cache_put"""
+    with _status_cache_lock:
+        return _status_cache_epoch, _status_cache_gen.get(user_id, 0)
+
+def status_cache_put(app_name, user_id, payload, generation):
+    with _status_cache_lock:
+        if generation != (_status_cache_epoch, _status_cache_gen.get(user_id, 0)):
+            return   # 读库期间这个用户的缓存被失效过，手里的结果可能是旧的，不写回
+        if len(_status_cache) >= STATUS_CACHE_MAX:
+            _status_cache.clear()   # 简单粗暴：满了整体清空，避免维护 LRU 顺序
+        _status_cache[(app_name, user_id)] = (time.time() + STATUS_CACHE_TTL, payload)
+
+def status_cache_invalidate(user_id):
+    global _status_cache_epoch
+    with _status_cache_lock:
+        for app_name in ALLOWED_APPS:
+            _status_cache.pop((app_name, user_id), None)
+        if len(_status_cache_gen) >= STATUS_CACHE_MAX:
+            # 代数表同样有上限：清空时换 epoch，清空前取到的代数全部作废
+            _status_cache_gen.clear()
+            _status_cache_epoch += 1
+        _status_cache_gen[user_id] = _status_cache_gen.get(user_id, 0) + 1
+
+def status_cache_clear():
+    global _status_cache_epoch
+    with _status_cache_lock:
+        _status_cache.clear()
+        _status_cache_gen.clear()
+        _status_cache_epoch += 1
+
 # --- 用户认证与权限核心逻辑 ---
+def _build_subscription_sql(app_name):
+    """某个 App 的订阅字段名与相关 SQL，启动时生成一次。
+       SQL 文本按 (App, 操作) 固定，请求中不再拼字符串，也能稳定命中 sqlite3 的语句缓存"""
+    prefix = app_name.lower()
+    perm_col = f"{prefix}_is_permanent"
+    expire_col = f"{prefix}_expire_at"
+    expire_ts_col = f"{prefix}_expire_ts"
+    # check_user_subscription_status 实际读取的列，用于替代 SELECT *
+    columns = f"{perm_col}, {expire_col}, {expire_ts_col}"
+    return {
+        'perm_col': perm_col,
+        'expire_col': expire_col,
+        'expire_ts_col': expire_ts_col,
+        'columns': columns,
+        'select_status': f"SELECT {columns} FROM users WHERE apple_user_id = ? LIMIT 1",
+        # 登录：新用户插入记录，老用户更新登录时间并关联/更新最新的 device_id，一条语句返回权限字段。
+        # 时间由 SQLite 生成（UTC，同一条语句内 'now' 取值一致），Python 侧不再为每次登录构造 datetime
+        'upsert_login': f"""INSERT INTO users (apple_user_id, device_id, created_at, last_login_at)
+                            VALUES (?1, ?2, strftime('%Y-%m-%d %H:%M:%f', 'now'), strftime('%Y-%m-%d %H:%M:%f', 'now'))
+                            ON CONFLICT(apple_user_id) DO UPDATE SET
+                                last_login_at = excluded.last_login_at,
+                                device_id = excluded.device_id
+                            RETURNING {columns}""",
+        'redeem': f"UPDATE users SET {perm_col} = 1 WHERE apple_user_id = ? RETURNING id",
+        # 同步：直接写入客户端给的过期时间
+        'update_expiry': f"UPDATE users SET {expire_col} = ?, {expire_ts_col} = ? WHERE apple_user_id = ? RETURNING id",
+        # 充值：还没过期就在原到期时间上顺延，否则从现在算起。新时间在 SQL 里算好，一条语句原子完成读+写
+        # 参数: ?1 = 当前 unix 秒, ?2 = 顺延秒数, ?3 = apple_user_id
+        'renew_expiry': f"""UPDATE users SET
+                                {expire_ts_col} = MAX(COALESCE({expire_ts_col}, 0), ?1) + ?2,
+                                {expire_col} = strftime('%Y-%m-%dT%H:%M:%S', MAX(COALESCE({expire_ts_col}, 0), ?1) + ?2, 'unixepoch')
+                            WHERE apple_user_id = ?3
+                            RETURNING {expire_col}""",
+    }
+
+# app_name -> 上面的字段/SQL 字典；只包含有独立订阅字段的应用
+SUBSCRIPTION_SQL = {app: _build_subscription_sql(app)
+                    for app in ALLOWED_APPS if app.lower() in SUBSCRIPTION_APP_PREFIXES}
+
+# 永久 VIP (亲友/后门) 对外显示的过期时间：一个极远的未来时间，让前端显示“长期有效”或类似效果
+VIP_EXPIRY = "2099-12-31T23:59:59"
+
 def check_user_subscription_status(user_row, app_name):
     """
     检查用户权限。
@@ -2447,33 +2935,27 @@ def check_user_subscription_status(user_row, app_name):
     2. 再检查该 App 的 expire_at (付费)。如果时间还没到，返回该时间。
     3. 否则返回 False。
     """
-    now = datetime.utcnow()
-    
     # 根据传入的 app_name 决定查哪些字段
-    # 比如 app_name="Finance" -> prefix="finance"
-    prefix = app_name.lower() 
-    perm_col = f"{prefix}_is_permanent"
-    expire_col = f"{prefix}_expire_at"
+    # 比如 app_name="Finance" -> finance_is_permanent / finance_expire_at / finance_expire_ts
+    sql = SUBSCRIPTION_SQL[app_name]
+    perm_col = sql['perm_col']
+    expire_col = sql['expire_col']
+    expire_ts_col = sql['expire_ts_col']
     
     # 1. 【优先】检查永久 VIP (亲友/后门)
     # 数据库里取出来可能是 1 或 True，做个兼容
     if user_row[perm_col] == 1:
-        # 对于亲友，我们返回一个极远的未来时间，让前端显示“长期有效”或类似效果
-        return True, "2099-12-31T23:59:59"
+        return True, VIP_EXPIRY
         
-    # 2. 检查付费订阅的过期时间
-    if user_row[expire_col]:
-        try:
-            # 数据库存的是字符串，转回 datetime
-            expires_at = datetime.fromisoformat(str(user_row[expire_col]))
-            if expires_at > now:
-                return True, user_row[expire_col]
-            else:
-                # 【优化】如果已经过期，虽然逻辑上返回 False，
-                # 但可以在这里记录一下，或者由 App 端下次登录时更新
-                return False, user_row[expire_col]
-        except:
-            pass
+    # 2. 检查付费订阅的过期时间（整数 unix 秒比较；解析不了的时间串 ts 为 NULL，按无订阅处理）
+    expires_ts = user_row[expire_ts_col]
+    if user_row[expire_col] and expires_ts is not None:
+        if expires_ts > time.time():
+            return True, user_row[expire_col]
+        else:
+            # 【优化】如果已经过期，虽然逻辑上返回 False，
+            # 但可以在这里记录一下，或者由 App 端下次登录时更新
+            return False, user_row[expire_col]
             
     return False, None
 
@@ -2484,65 +2966,119 @@ def handle_auth(app_name):
         user_id = data.get('user_id')
         device_id = data.get('device_id') # 【新增】接收客户端传来的设备ID
         
-        if not user_id: return jsonify({"error": "Missing user_id"}), 400
-        conn = sqlite3.connect(USER_DB_PATH, timeout=60.0)
-        conn.row_factory = sqlite3.Row
+        if not user_id: return ojsonify({"error": "Missing user_id"}, 400)
+        conn = get_user_db()
         c = conn.cursor()
-        c.execute("SELECT * FROM users WHERE apple_user_id = ?", (user_id,))
-        user = c.fetchone()
-        now = datetime.utcnow()
-        is_subscribed = False
-        expiration_date = None
-        if user:
-            # 老用户：更新登录时间，同时关联/更新最新的 device_id
-            c.execute(
-                "UPDATE users SET last_login_at = ?, device_id = ? WHERE apple_user_id = ?", 
-                (now, device_id, user_id)
-            )
-            # 检查权限 (传入 app_name)
-            is_subscribed, expiration_date = check_user_subscription_status(user, app_name)
-        else:
-            # 新用户：插入记录，同时写入 device_id
-            c.execute(
-                "INSERT INTO users (apple_user_id, device_id, created_at, last_login_at) VALUES (?, ?, ?, ?)",
-                (user_id, device_id, now, now)
-            )
-            # 新用户肯定没订阅且不是VIP
+        # 【性能】一条 UPSERT 完成：新用户插入记录，老用户更新登录时间并关联/更新最新的 device_id；
+        # 只 RETURNING 权限判断需要的列。省掉先 SELECT 再分支，也不存在并发首登时 INSERT 撞唯一键的问题
+        with conn:
+            c.execute(SUBSCRIPTION_SQL[app_name]['upsert_login'], (user_id, device_id))
+            user = c.fetchone()
+        # 检查权限 (传入 app_name)；新用户各字段都是默认值，自然是未订阅
+        is_subscribed, expiration_date = check_user_subscription_status(user, app_name)
         
-        conn.commit()
-        conn.close()
-        return jsonify({
+        return ojsonify({
             "status": "success", 
             "is_subscribed": is_subscribed,
             "subscription_expires_at": expiration_date,
             "video_module_blocked": user_id in VIDEO_MODULE_BLOCKED_USERS   # 【新增】
-        }), 200
+        }, 200)
     except Exception as e:
-        traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
+        logger.exception("请求处理失败: %s", request.path)
+        return ojsonify({"error": str(e)}, 500)
+
+@lru_cache(maxsize=16)
+def _status_select_sql(app_names):
+    """多个 App 的订阅字段一次性查出（app_names 为 tuple，按组合缓存 SQL 文本）"""
+    if len(app_names) == 1:
+        return SUBSCRIPTION_SQL[app_names[0]]['select_status']
+    columns = ", ".join(SUBSCRIPTION_SQL[app_name]['columns'] for app_name in app_names)
+    return f"SELECT {columns} FROM users WHERE apple_user_id = ? LIMIT 1"
+
+def load_status_payloads(user_id, app_names):
+    """返回 {app_name: 状态 dict}。先查内存缓存，未命中的 App 合并成一次查询读同一行"""
+    payloads = {}
+    missing = []
+    for app_name in app_names:
+        cached = status_cache_get(app_name, user_id)
+        if cached is None:
+            missing.append(app_name)
+        else:
+            payloads[app_name] = cached
+    if missing:
+        generation = status_cache_generation(user_id)
+        c = get_user_db().cursor()
+        c.execute(_status_select_sql(tuple(missing)), (user_id,))
+        row = c.fetchone()
+        video_module_blocked = user_id in VIDEO_MODULE_BLOCKED_USERS   # 【新增】
+        for app_name in missing:
+            is_subscribed = False
+            expires_at_str = None
+            if row:
+                is_subscribed, expires_at_str = check_user_subscription_status(row, app_name)
+            payload = {
+                "is_subscribed": is_subscribed, 
+                "subscription_expires_at": expires_at_str,
+                "video_module_blocked": video_module_blocked
+            }
+            status_cache_put(app_name, user_id, payload, generation)
+            payloads[app_name] = payload
+    return payloads
 
 def handle_status_check(app_name):
     user_id = request.args.get('user_id')
-    if not user_id: return jsonify({"error": "Missing user_id"}), 400
-    conn = sqlite3.connect(USER_DB_PATH, timeout=60.0)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
+    if not user_id: return ojsonify({"error": "Missing user_id"}, 400)
     try:
-        c.execute("SELECT * FROM users WHERE apple_user_id = ?", (user_id,))
-        row = c.fetchone()
-        is_subscribed = False
-        expires_at_str = None
-        if row:
-            is_subscribed, expires_at_str = check_user_subscription_status(row, app_name)
-        return jsonify({
-            "is_subscribed": is_subscribed, 
-            "subscription_expires_at": expires_at_str,
-            "video_module_blocked": user_id in VIDEO_MODULE_BLOCKED_USERS   # 【新增】
-        })
+        return ojsonify(load_status_payloads(user_id, (app_name,))[app_name])
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
-    finally:
-        conn.close()
+        return ojsonify({"error": str(e)}, 500)
+
+# 【性能】兑换接口的响应体都是常量，启动时用 orjson 编码一次，请求里只包一层 Response，不再逐次序列化
+# （Response 对象本身不能复用：Compress/CORS 会改写它的响应头）
+_REDEEM_BODIES = {
+    'ok': orjson.dumps({"status": "success", "is_subscribed": True, "subscription_expires_at": VIP_EXPIRY}),
+    'missing': orjson.dumps({"error": "缺少参数"}),
+    'too_frequent': orjson.dumps({"error": "Too frequent"}),
+    'invalid_code': orjson.dumps({"error": "无效的邀请码"}),
+    'no_user': orjson.dumps({"error": "用户不存在，请先登录"}),
+}
+
+def _redeem_response(key, status=200):
+    return app.response_class(_REDEEM_BODIES[key], status=status, mimetype='application/json')
+
+def _client_ip():
+    """限流用的客户端地址：直连取 remote_addr；经本机 nginx 转发时取 nginx 追加的最后一跳 X-Forwarded-For
+       （前面几跳是客户端自己带上来的，可以伪造，不能用）"""
+    addr = request.remote_addr
+    if addr in TRUSTED_PROXY_ADDRS:
+        forwarded = request.headers.get('X-Forwarded-For')
+        if forwarded:
+            return forwarded.rsplit(',', 1)[-1].strip() or addr
+    return addr
+
+def _invite_throttled(client_ip):
+    now_ts = time.time()
+    with _invite_fail_lock:
+        entry = invite_fail_log.get(client_ip)
+        return entry is not None and now_ts - entry[0] < INVITE_FAIL_WINDOW and entry[1] >= INVITE_FAIL_LIMIT
+
+def _record_invite_failure(client_ip):
+    now_ts = time.time()
+    with _invite_fail_lock:
+        entry = invite_fail_log.get(client_ip)
+        if entry is not None and now_ts - entry[0] < INVITE_FAIL_WINDOW:
+            # 窗口内原地累加，保持在字典中的位置不变
+            invite_fail_log[client_ip] = (entry[0], entry[1] + 1)
+            return
+        # 开新窗口：删掉再插入，字典顺序始终按窗口起点从老到新
+        invite_fail_log.pop(client_ip, None)
+        # 先从最前面清掉已过窗口期的记录；仍然满了就淘汰最老的，保证不超过上限
+        while invite_fail_log:
+            oldest_ip, (oldest_start, _) = next(iter(invite_fail_log.items()))
+            if now_ts - oldest_start < INVITE_FAIL_WINDOW and len(invite_fail_log) < INVITE_FAIL_LOG_MAX:
+                break
+            del invite_fail_log[oldest_ip]
+        invite_fail_log[client_ip] = (now_ts, 1)
 
 # 【新增】处理邀请码兑换
 def handle_redeem_invite(app_name):
@@ -2550,34 +3086,32 @@ def handle_redeem_invite(app_name):
     user_id = data.get('user_id')
     invite_code = data.get('invite_code')
     if not user_id or not invite_code:
-        return jsonify({"error": "缺少参数"}), 400
+        return _redeem_response('missing', 400)
         
-    # 验证邀请码
+    # 验证邀请码（纯内存判断，错误的邀请码不会借数据库连接）
+    client_ip = _client_ip()
+    if _invite_throttled(client_ip):
+        return _redeem_response('too_frequent', 429)
     if invite_code not in VALID_INVITE_CODES:
-        return jsonify({"error": "无效的邀请码"}), 403
-    conn = sqlite3.connect(USER_DB_PATH, timeout=60.0)
+        _record_invite_failure(client_ip)
+        return _redeem_response('invalid_code', 403)
+    conn = get_user_db()
     c = conn.cursor()
     try:
-        # 确定要更新哪个字段
-        perm_col = f"{app_name.lower()}_is_permanent"
-        
-        # 设置永久 VIP 标记为 1
-        query = f"UPDATE users SET {perm_col} = 1 WHERE apple_user_id = ?"
-        c.execute(query, (user_id,))
-        if c.rowcount == 0:
-            return jsonify({"error": "用户不存在，请先登录"}), 404
-        conn.commit()
-        print(f"[{app_name}] 用户 {user_id} 使用邀请码 {invite_code} 升级为永久 VIP")
-        
-        return jsonify({
-            "status": "success",
-            "is_subscribed": True,
-            "subscription_expires_at": "2099-12-31T23:59:59"
-        })
+        # 设置该 App 的永久 VIP 标记为 1；RETURNING 一次往返同时确认用户是否存在
+        with conn:
+            c.execute(SUBSCRIPTION_SQL[app_name]['redeem'], (user_id,))
+            updated = c.fetchone()
+        if updated is None:
+            return _redeem_response('no_user', 404)
+        status_cache_invalidate(user_id)
+        logger.info("[%s] 用户 %s 使用邀请码 %s 升级为永久 VIP", app_name, user_id, invite_code)
+        return _redeem_response('ok')
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
-    finally:
-        conn.close()
+        return ojsonify({"error": str(e)}, 500)
+
+# 充值模式单次最多顺延的天数（100 年）
+PAYMENT_MAX_DAYS = 36500
 
 def handle_payment(app_name):
     data = request.get_json()
@@ -2585,52 +3119,47 @@ def handle_payment(app_name):
     days = data.get('days', 30) # 保持默认值用于兼容旧版本或手动充值
     # 【新增】接收客户端传来的真实过期时间字符串 (ISO 8601 格式)
     explicit_expiry = data.get('explicit_expiry') 
-    if not user_id: return jsonify({"error": "Missing user_id"}), 400
-    conn = sqlite3.connect(USER_DB_PATH, timeout=60.0)
-    conn.row_factory = sqlite3.Row
+    if not user_id: return ojsonify({"error": "Missing user_id"}, 400)
+    conn = get_user_db()
     c = conn.cursor()
+    # 确定要更新哪个字段
+    sql = SUBSCRIPTION_SQL[app_name]
     try:
-        c.execute("SELECT * FROM users WHERE apple_user_id = ?", (user_id,))
-        row = c.fetchone()
-        if not row: return jsonify({"error": "User not found"}), 404
-        now = datetime.utcnow()
-        
-        # 确定要更新哪个字段
-        expire_col = f"{app_name.lower()}_expire_at"
-        new_expiry_str = ""
-
-        # 【核心修改】逻辑分支
+        # 【关键】两种模式都是单条 UPDATE ... RETURNING，用户不存在时不返回行。
+        # 充值的“读旧过期时间 + 写新过期时间”也在同一条语句里完成，并发续费不会读到同一个旧值
         if explicit_expiry:
             # 方案 A: 客户端传了真实的 Apple 过期时间，直接使用
             # 这样就实现了"同步"，而不是"充值"
-            print(f"[{app_name}] 同步用户 {user_id} 订阅时间至: {explicit_expiry}")
+            c.execute(sql['update_expiry'], (explicit_expiry, _iso_to_ts(explicit_expiry), user_id))
+            row = c.fetchone()
             new_expiry_str = explicit_expiry
+            if row is not None:
+                logger.info("[%s] 同步用户 %s 订阅时间至: %s", app_name, user_id, explicit_expiry)
         else:
             # 方案 B: 旧逻辑 (充值模式) - 依然保留以备不时之需
-            current_expiry_str = row[expire_col]
-            new_expiry = now + timedelta(days=days) 
-            
-            if current_expiry_str:
-                try:
-                    current_expiry = datetime.fromisoformat(current_expiry_str)
-                    if current_expiry > now:
-                        new_expiry = current_expiry + timedelta(days=days)
-                except: pass
-            new_expiry_str = new_expiry.isoformat()
-        
-        # 执行更新
-        query = f"UPDATE users SET {expire_col} = ? WHERE apple_user_id = ?"
-        c.execute(query, (new_expiry_str, user_id))
-        conn.commit()
-        return jsonify({
+            # 只接受有限的正数天数：Infinity/NaN 无法换算成整数秒，过大的值会超出 strftime 支持的 9999 年
+            if (isinstance(days, bool) or not isinstance(days, (int, float))
+                    or not math.isfinite(days) or not 0 < days <= PAYMENT_MAX_DAYS):
+                return ojsonify({"error": "Invalid days"}, 400)
+            # 显式事务：算出的过期时间转不成日期串（strftime 返回 NULL，比如原到期时间已经接近 9999 年）时整体回滚，不留半截数据
+            c.execute("BEGIN IMMEDIATE")
+            c.execute(sql['renew_expiry'], (int(time.time()), int(days * 86400), user_id))
+            row = c.fetchone()
+            if row is not None and row[0] is None:
+                c.execute("ROLLBACK")
+                return ojsonify({"error": "Invalid expiry"}, 400)
+            c.execute("COMMIT" if row is not None else "ROLLBACK")
+            new_expiry_str = row[0] if row else None
+        if row is None:
+            return ojsonify({"error": "User not found"}, 404)
+        status_cache_invalidate(user_id)
+        return ojsonify({
             "status": "success", 
             "is_subscribed": True, 
             "subscription_expires_at": new_expiry_str
         })
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
-    finally:
-        conn.close()
+        return ojsonify({"error": str(e)}, 500)
 
 # Onews 新闻类接口
 @app.route('/api/ONews/track', methods=['POST'])
@@ -2670,7 +3199,7 @@ def track_news_event():
         conn.close()
         return jsonify({"status": "ok"}), 200
     except Exception as e:
-        traceback.print_exc()
+        logger.exception("请求处理失败: %s", request.path)
         return jsonify({"error": str(e)}), 500
     
 @app.route('/admin/login', methods=['POST'])
@@ -2800,7 +3329,7 @@ def news_quota_unlock():
     except Exception as e:
         try: c.execute("ROLLBACK")
         except Exception: pass
-        traceback.print_exc()
+        logger.exception("请求处理失败: %s", request.path)
         return jsonify({"error": str(e)}), 500
     finally:
         conn.close()
@@ -2853,7 +3382,7 @@ def _do_invite_redeem(table, cfg_getter):
     except Exception as e:
         try: c.execute("ROLLBACK")
         except Exception: pass
-        traceback.print_exc()
+        logger.exception("请求处理失败: %s", request.path)
         return jsonify({"error": str(e)}), 500
     finally:
         conn.close()
@@ -2942,6 +3471,29 @@ def finance_pay(): return handle_payment('Finance')
 @app.route('/api/Finance/user/status', methods=['GET'])
 def finance_status(): return handle_status_check('Finance')
 
+# --- 多 App 状态合并查询 ---
+# 同时用多个 App 的客户端一次请求拿到全部状态：/api/user/status_multi?user_id=xxx[&apps=ONews,Finance]
+# 不传 apps 时返回所有有订阅字段的 App；返回 {"onews": {...}, "finance": {...}}，每项与单个 /user/status 相同
+_SUBSCRIPTION_APP_BY_KEY = {app_name.lower(): app_name for app_name in SUBSCRIPTION_SQL}
+
+@app.route('/api/user/status_multi', methods=['GET'])
+def user_status_multi():
+    user_id = request.args.get('user_id')
+    if not user_id: return ojsonify({"error": "Missing user_id"}, 400)
+    apps_param = request.args.get('apps')
+    if apps_param:
+        keys = [k.strip().lower() for k in apps_param.split(',') if k.strip()]
+        if not keys or any(k not in _SUBSCRIPTION_APP_BY_KEY for k in keys):
+            return ojsonify({"error": "无效的应用名称"}, 400)
+        app_names = list(dict.fromkeys(_SUBSCRIPTION_APP_BY_KEY[k] for k in keys))
+    else:
+        app_names = sorted(SUBSCRIPTION_SQL)
+    try:
+        payloads = load_status_payloads(user_id, app_names)
+        return ojsonify({app_name.lower(): payloads[app_name] for app_name in app_names})
+    except Exception as e:
+        return ojsonify({"error": str(e)}, 500)
+
 # 注册 Finance 的兑换路由！！！
 @app.route('/api/Finance/user/redeem', methods=['POST'])
 def finance_redeem(): return handle_redeem_invite('Finance')
@@ -2960,32 +3512,27 @@ def finance_quota_status():
             "has_redeemed_invite": False, "unlocked_keys": [],
             "invite_reward_points": cfg['invite_reward_points']
         })
-    conn = sqlite3.connect(USER_DB_PATH, timeout=30.0)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    try:
-        row, cfg = _ensure_finance_points(c, user_id)
-        today = today_str()
-        keys = [r['item_key'] for r in c.execute(
-            "SELECT item_key FROM finance_daily_unlocks WHERE user_id=? AND unlock_date=?",
-            (user_id, today)).fetchall()]
-        conn.commit()
-        daily_remaining = max(0, cfg['daily_free_limit'] - row['daily_used'])
-        total = row['bonus_remaining'] + daily_remaining
-        return jsonify({
-            "logged_in": True,
-            "daily_limit": cfg['daily_free_limit'],
-            "daily_used": row['daily_used'],
-            "bonus_remaining": row['bonus_remaining'],
-            "remaining_total": total,
-            "invite_code": row['invite_code'],
-            "invite_reward_count": row['invite_reward_count'],
-            "has_redeemed_invite": bool(row['invited_by_code']),
-            "unlocked_keys": keys,
-            "invite_reward_points": cfg['invite_reward_points']
-        })
-    finally:
-        conn.close()
+    c = get_user_db().cursor()
+    # 建行/跨天重置都是单条 INSERT/UPDATE，自动提交即可
+    row, cfg = _ensure_finance_points(c, user_id)
+    today = today_str()
+    keys = [r['item_key'] for r in c.execute(
+        "SELECT item_key FROM finance_daily_unlocks WHERE user_id=? AND unlock_date=?",
+        (user_id, today)).fetchall()]
+    daily_remaining = max(0, cfg['daily_free_limit'] - row['daily_used'])
+    total = row['bonus_remaining'] + daily_remaining
+    return jsonify({
+        "logged_in": True,
+        "daily_limit": cfg['daily_free_limit'],
+        "daily_used": row['daily_used'],
+        "bonus_remaining": row['bonus_remaining'],
+        "remaining_total": total,
+        "invite_code": row['invite_code'],
+        "invite_reward_count": row['invite_reward_count'],
+        "has_redeemed_invite": bool(row['invited_by_code']),
+        "unlocked_keys": keys,
+        "invite_reward_points": cfg['invite_reward_points']
+    })
 
 @app.route('/api/Finance/quota/consume', methods=['POST'])
 def finance_quota_consume():
@@ -3001,9 +3548,7 @@ def finance_quota_consume():
     unlock_key = f"{action}|{item_key.upper()}" if item_key else action
     today = today_str()
 
-    conn = sqlite3.connect(USER_DB_PATH, timeout=30.0, isolation_level=None)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
+    c = get_user_db().cursor()
     try:
         c.execute("BEGIN IMMEDIATE")
         row, cfg = _ensure_finance_points(c, user_id)
@@ -3048,10 +3593,8 @@ def finance_quota_consume():
     except Exception as e:
         try: c.execute("ROLLBACK")
         except Exception: pass
-        traceback.print_exc()
+        logger.exception("请求处理失败: %s", request.path)
         return jsonify({"status": "error", "error": str(e)}), 500
-    finally:
-        conn.close()
 
 # Finance 邀请拉新
 @app.route('/api/Finance/invite/redeem', methods=['POST'])
@@ -3067,9 +3610,7 @@ def finance_invite_redeem():
     cfg = get_finance_config()
     reward_points = cfg['invite_reward_points']
 
-    conn = sqlite3.connect(USER_DB_PATH, timeout=30.0, isolation_level=None)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
+    c = get_user_db().cursor()
     inviter_id = None
     invitee_bonus = 0
     invitee_total = 0
@@ -3113,10 +3654,8 @@ def finance_invite_redeem():
     except Exception as e:
         try: c.execute("ROLLBACK")
         except Exception: pass
-        traceback.print_exc()
+        logger.exception("请求处理失败: %s", request.path)
         return jsonify({"error": str(e)}), 500
-    finally:
-        conn.close()
 
     _log_finance_invite(inviter_id, code, invitee_id, reward_points)
     return jsonify({
@@ -3158,31 +3697,175 @@ def track_finance_event():
         conn.close()
         return jsonify({"status": "ok"}), 200
     except Exception as e:
-        traceback.print_exc()
+        logger.exception("请求处理失败: %s", request.path)
         return jsonify({"error": str(e)}), 500
 
 # 新增：Finance 数据查询 API (替代本地 SQL)
 
+_NO_ITEM = object()
+
+def _stream_json_array(first, items, label):
+    """把 first 和其余 items 逐条用 orjson 编码，按 JSON 数组分块输出（首字节不必等全部结果）。
+       中途出错时记日志后继续抛出、不补 ']'：响应头已是 200，只能让服务器中断连接，
+       客户端拿到的是不完整的分块传输，而不是一个能被当成完整结果解析的截断数组"""
+    if first is _NO_ITEM:
+        yield b'[]'
+        return
+    yield b'[' + orjson.dumps(first)
+    try:
+        for item in items:
+            yield b',' + orjson.dumps(item)
+    except Exception:
+        logger.exception("%s 流式输出中途失败，中断响应", label)
+        raise
+    yield b']'
+
+def _json_array_response(items, label):
+    """流式 JSON 数组响应。先在当前（调用方 try 内）同步取第一条：SQLite 的错误大多在首次 step 时抛出，
+       这样仍由调用方的 except 返回 500 JSON，而不是发出 200 之后才失败。
+       stream_with_context 让请求上下文保持到生成器结束，teardown 在响应体发完后才执行"""
+    items = iter(items)
+    first = next(items, _NO_ITEM)
+    return Response(stream_with_context(_stream_json_array(first, items, label)), mimetype='application/json')
+
+# 客户端传入的表名会拼进 SQL：只接受 Finance.db 里真实存在的表（白名单），未知表名直接 400。
+# 【性能】白名单懒加载后常驻内存；每张表用到的 SQL 按表结构生成一次后缓存，请求里不再查 PRAGMA、拼字符串
+FINANCE_TABLES_REFRESH_INTERVAL = 60   # 秒；遇到未知表名时最多这么久重读一次 sqlite_master（导入脚本可能新增表）
+_finance_tables = frozenset()
+_finance_tables_loaded_at = None
+_finance_table_sql = {}   # table -> {'optional_fields', 'historical_row', 'historical', 'closing_price', 'latest_volume'}
+
+def _finance_table_exists(db, table_name):
+    global _finance_tables, _finance_tables_loaded_at
+    if table_name in _finance_tables:
+        return True
+    now = time.monotonic()
+    if _finance_tables_loaded_at is None or now - _finance_tables_loaded_at >= FINANCE_TABLES_REFRESH_INTERVAL:
+        _finance_tables = frozenset(r[0] for r in db.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'"))
+        _finance_tables_loaded_at = now
+        _finance_table_sql.clear()   # 表结构可能也变了，SQL 重新生成
+    return table_name in _finance_tables
+
+def _historical_row_builder(optional_fields):
+    """
+    【性能】按表结构特化的 行 -> dict 函数，随 SQL 一起按表缓存：
+    只有 date/price 的表直接构造，不再每行走一遍空的可选字段循环；
+    其余表的字段下标预先算好，每行只做取值和判空
+    """
+    if not optional_fields:
+        return lambda row: {"date": row[0], "price": row[1]}
+    indexed_fields = tuple(enumerate(optional_fields, 2))
+
+    def build(row):
+        item = {"date": row[0], "price": row[1]}
+        # 动态添加存在且非空的字段
+        for i, field in indexed_fields:
+            value = row[i]
+            if value is not None:
+                item[field] = value
+        return item
+    return build
+
+def _finance_table_queries(db, table_name):
+    """返回该表预先生成的 SQL；table_name 须已通过 _finance_table_exists 校验"""
+    queries = _finance_table_sql.get(table_name)
+    if queries is None:
+        quoted = '"' + table_name.replace('"', '""') + '"'
+        columns = {row['name'].lower() for row in db.execute(f'PRAGMA table_info({quoted})')}
+        # date, price 固定在前两列，其后是表里实际存在的可选字段
+        optional_fields = tuple(f for f in ("volume", "open", "high", "low") if f in columns)
+        select_clause = ", ".join(("date", "price") + optional_fields)
+        queries = _finance_table_sql[table_name] = {
+            'optional_fields': optional_fields,
+            'historical_row': _historical_row_builder(optional_fields),
+            'historical': f"""SELECT {select_clause} FROM {quoted}
+                              WHERE name = ? AND date BETWEEN ? AND ?
+                              ORDER BY date ASC""",
+            'closing_price': f'SELECT price FROM {quoted} WHERE name = ? AND date = ? LIMIT 1',
+            # 没有 volume 列的表为 None
+            'latest_volume': (f'SELECT volume FROM {quoted} WHERE name = ? ORDER BY date DESC LIMIT 1'
+                              if 'volume' in columns else None),
+        }
+    return queries
+
+def _tuple_cursor(db):
+    """【性能】大结果集用原生 tuple 行：按位置取值，省掉 sqlite3.Row 逐列按名字查找"""
+    cur = db.cursor()
+    cur.row_factory = None
+    return cur
+
+def _columnar(fields, rows):
+    """
+    【性能】?format=columnar：按列输出 {"字段": [...], ...}，不再为每一行分配一个 dict，
+    体积也比逐行对象小；空值保留为 null 以保证各列等长。没有数据时每列都是空数组
+    """
+    columns_data = zip(*rows) if rows else ([] for _ in fields)
+    return dict(zip(fields, map(list, columns_data)))
+
+def _finance_data_version():
+    """
+    Finance.db 当前的数据版本：主库与 -wal 文件的 inode/mtime/size。导入脚本写入（落在 -wal）、
+    checkpoint 或整体替换库文件都会让它变化。库不存在时返回 None
+    """
+    try:
+        st = os.stat(FINANCE_DB_PATH)
+    except OSError:
+        return None
+    # 空的 -wal（只读连接打开时就会建出来，checkpoint 截断后也是空的）不携带数据，与不存在等同
+    try:
+        wal = os.stat(FINANCE_DB_PATH + '-wal')
+        wal_key = f"{wal.st_mtime_ns:x}.{wal.st_size:x}" if wal.st_size else "0"
+    except OSError:
+        wal_key = "0"
+    return f"{st.st_ino:x}.{st.st_mtime_ns:x}.{st.st_size:x}-{wal_key}"
+
+def _not_modified(etag):
+    """【性能】客户端带的 If-None-Match 命中时返回 304 响应（不查库、不序列化），否则返回 None。
+       用弱 ETag：Flask-Compress 压缩时不改写弱 ETag，gzip 与否都能命中"""
+    if request.if_none_match.contains_weak(etag):
+        resp = app.response_class(status=304)
+        resp.set_etag(etag, weak=True)
+        return resp
+    return None
+
+# 【性能】市值表每天最多更新一次，整表结果按输出格式缓存编码好的字节，命中时不碰数据库、不再序列化。
+# 缓存带着生成时的数据版本，Finance.db 有写入就不再命中；导入脚本也可调 /admin/api/flush_finance_cache 立即失效
+MARKET_CAP_CACHE_TTL = 300   # 秒
+_market_cap_cache = {}       # format -> (过期时间戳, 数据版本, 响应 JSON 字节)
+
 # 1. 获取所有市值数据
 @app.route('/api/Finance/query/market_cap', methods=['GET'])
 def query_market_cap():
+    columnar = request.args.get('format') == 'columnar'
+    version = _finance_data_version()
+    if version is None: return ojsonify({"error": "Database not found"}, 500)
+    etag = f"mc-{int(columnar)}-{version}"
+    not_modified = _not_modified(etag)
+    if not_modified is not None:
+        return not_modified
+    cached = _market_cap_cache.get(columnar)
+    if cached is not None and cached[0] > time.time() and cached[1] == version:
+        resp = app.response_class(cached[2], mimetype='application/json')
+        resp.set_etag(etag, weak=True)
+        return resp
     db = get_finance_db()
-    if not db: return jsonify({"error": "Database not found"}), 500
+    if not db: return ojsonify({"error": "Database not found"}, 500)
     try:
         # 对应 fetchAllMarketCapData
-        cur = db.execute('SELECT symbol, marketcap, pe_ratio, pb FROM "MNSPP"')
-        rows = cur.fetchall()
-        result = []
-        for row in rows:
-            result.append({
-                "symbol": row["symbol"],
-                "marketCap": row["marketcap"],
-                "peRatio": row["pe_ratio"],
-                "pb": row["pb"]
-            })
-        return jsonify(result)
+        cur = _tuple_cursor(db).execute('SELECT symbol, marketcap, pe_ratio, pb FROM "MNSPP"')
+        if columnar:
+            result = _columnar(("symbol", "marketCap", "peRatio", "pb"), cur.fetchall())
+        else:
+            result = [{"symbol": symbol, "marketCap": market_cap, "peRatio": pe_ratio, "pb": pb}
+                      for symbol, market_cap, pe_ratio, pb in cur.fetchall()]
+        body = orjson.dumps(result)
+        _market_cap_cache[columnar] = (time.time() + MARKET_CAP_CACHE_TTL, version, body)
+        resp = app.response_class(body, mimetype='application/json')
+        resp.set_etag(etag, weak=True)
+        return resp
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return ojsonify({"error": str(e)}, 500)
 
 # 2. 获取历史价格数据
 @app.route('/api/Finance/query/historical', methods=['GET'])
@@ -3193,75 +3876,55 @@ def query_historical():
     end_date = request.args.get('end')
     
     if not all([symbol, table_name, start_date, end_date]):
-        return jsonify({"error": "Missing parameters"}), 400
+        return ojsonify({"error": "Missing parameters"}, 400)
         
     db = get_finance_db()
-    if not db: return jsonify({"error": "Database not found"}), 500
+    if not db: return ojsonify({"error": "Database not found"}, 500)
     
     try:
-        # 【修改】查询不再包含 id，改为返回所有可能的字段
-        # 先检查表结构
-        cur = db.execute(f'PRAGMA table_info("{table_name}")')
-        columns = [row['name'].lower() for row in cur.fetchall()]
-        
-        # 构建动态 SELECT 语句
-        select_fields = ["date", "price"]
-        if "volume" in columns:
-            select_fields.append("volume")
-        if "open" in columns:
-            select_fields.append("open")
-        if "high" in columns:
-            select_fields.append("high")
-        if "low" in columns:
-            select_fields.append("low")
-        
-        select_clause = ", ".join(select_fields)
-        
-        query = f'''
-            SELECT {select_clause} 
-            FROM "{table_name}" 
-            WHERE name = ? AND date BETWEEN ? AND ? 
-            ORDER BY date ASC
-        '''
-        cur = db.execute(query, (symbol, start_date, end_date))
-        rows = cur.fetchall()
-        result = []
-        for row in rows:
-            item = {
-                "date": row["date"],
-                "price": row["price"]
-            }
-            # 动态添加存在的字段
-            if "volume" in columns and row["volume"] is not None:
-                item["volume"] = row["volume"]
-            if "open" in columns and row["open"] is not None:
-                item["open"] = row["open"]
-            if "high" in columns and row["high"] is not None:
-                item["high"] = row["high"]
-            if "low" in columns and row["low"] is not None:
-                item["low"] = row["low"]
-            result.append(item)
-        return jsonify(result)
+        if not _finance_table_exists(db, table_name):
+            return ojsonify({"error": "Invalid table"}, 400)
+        # 参数校验通过后才做 304 判断：非法 table 带着旧 ETag 也必须拿到 400。
+        # ETag = 数据版本 + 查询参数摘要，换了 symbol/区间/格式的请求不会误命中别的结果
+        version = _finance_data_version()
+        if version is None: return ojsonify({"error": "Database not found"}, 500)
+        params = "\0".join((table_name, symbol, start_date, end_date, request.args.get('format') or ''))
+        etag = f"h-{version}-{hashlib.sha1(params.encode()).hexdigest()[:12]}"
+        not_modified = _not_modified(etag)
+        if not_modified is not None:
+            return not_modified
+        # 【修改】查询不再包含 id，改为返回所有可能的字段（按表结构预先生成的 SQL）
+        queries = _finance_table_queries(db, table_name)
+        cur = _tuple_cursor(db).execute(queries['historical'], (symbol, start_date, end_date))
+        fields = ("date", "price") + queries['optional_fields']
+        if request.args.get('format') == 'columnar':
+            resp = ojsonify(_columnar(fields, cur.fetchall()))
+        else:
+            # 【性能】大区间查询不再先 fetchall 再拼列表：边读游标边编码输出，内存占用与行数无关
+            resp = _json_array_response(map(queries['historical_row'], cur), "historical")
+        resp.set_etag(etag, weak=True)
+        return resp
     except Exception as e:
-        print(f"Error querying historical: {e}")
-        return jsonify({"error": str(e)}), 500
+        logger.exception("Historical query failed table=%s", table_name)
+        return ojsonify({"error": str(e)}, 500)
 
 # 3. 获取财报数据
 @app.route('/api/Finance/query/earning', methods=['GET'])
 def query_earning():
     symbol = request.args.get('symbol')
-    if not symbol: return jsonify({"error": "Missing symbol"}), 400
+    if not symbol: return ojsonify({"error": "Missing symbol"}, 400)
     
     db = get_finance_db()
-    if not db: return jsonify({"error": "Database not found"}), 500
+    if not db: return ojsonify({"error": "Database not found"}, 500)
     
     try:
-        cur = db.execute('SELECT date, price FROM Earning WHERE name = ?', (symbol,))
-        rows = cur.fetchall()
-        result = [{"date": row["date"], "price": row["price"]} for row in rows]
-        return jsonify(result)
+        cur = _tuple_cursor(db).execute('SELECT date, price FROM Earning WHERE name = ?', (symbol,))
+        if request.args.get('format') == 'columnar':
+            return ojsonify(_columnar(("date", "price"), cur.fetchall()))
+        result = [{"date": date, "price": price} for date, price in cur.fetchall()]
+        return ojsonify(result)
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return ojsonify({"error": str(e)}, 500)
 
 # 4. 获取单日收盘价
 @app.route('/api/Finance/query/closing_price', methods=['GET'])
@@ -3270,44 +3933,57 @@ def query_closing_price():
     date = request.args.get('date')
     table_name = request.args.get('table')
     if not all([symbol, date, table_name]):
-        return jsonify({"error": "Missing parameters"}), 400
+        return ojsonify({"error": "Missing parameters"}, 400)
     db = get_finance_db()
-    if not db: return jsonify({"error": "Database not found"}), 500
+    if not db: return ojsonify({"error": "Database not found"}, 500)
     try:
-        query = f'SELECT price FROM "{table_name}" WHERE name = ? AND date = ? LIMIT 1'
-        cur = db.execute(query, (symbol, date))
+        if not _finance_table_exists(db, table_name):
+            return ojsonify({"error": "Invalid table"}, 400)
+        cur = db.execute(_finance_table_queries(db, table_name)['closing_price'], (symbol, date))
         row = cur.fetchone()
         if row:
-            return jsonify({"price": row["price"]})
+            return ojsonify({"price": row["price"]})
         else:
-            return jsonify({"price": None})
+            return ojsonify({"price": None})
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return ojsonify({"error": str(e)}, 500)
 
 # 5. 获取最新成交量
 @app.route('/api/Finance/query/latest_volume', methods=['GET'])
 def query_latest_volume():
     symbol = request.args.get('symbol')
     table_name = request.args.get('table')
-    if not all([symbol, table_name]): return jsonify({"error": "Missing parameters"}), 400
+    if not all([symbol, table_name]): return ojsonify({"error": "Missing parameters"}, 400)
     db = get_finance_db()
-    if not db: return jsonify({"error": "Database not found"}), 500
+    if not db: return ojsonify({"error": "Database not found"}, 500)
     try:
-        # 先检查是否有 volume 列，避免报错
-        cur = db.execute(f'PRAGMA table_info("{table_name}")')
-        columns = [row['name'].lower() for row in cur.fetchall()]
-        if 'volume' not in columns:
-             return jsonify({"volume": None})
-        query = f'SELECT volume FROM "{table_name}" WHERE name = ? ORDER BY date DESC LIMIT 1'
+        if not _finance_table_exists(db, table_name):
+            return ojsonify({"error": "Invalid table"}, 400)
+        # 没有 volume 列的表直接返回空，避免报错
+        query = _finance_table_queries(db, table_name)['latest_volume']
+        if query is None:
+             return ojsonify({"volume": None})
         cur = db.execute(query, (symbol,))
         row = cur.fetchone()
         if row:
-            return jsonify({"volume": row["volume"]})
+            return ojsonify({"volume": row["volume"]})
         else:
-            return jsonify({"volume": None})
+            return ojsonify({"volume": None})
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return ojsonify({"error": str(e)}, 500)
     
+# 一条 UNION ALL 最多拼多少个 symbol（SQLite 默认限制复合 SELECT 不超过 500 项）
+OPTIONS_SUMMARY_BATCH = 200
+
+@lru_cache(maxsize=64)
+def _options_summary_sql(n):
+    """按 symbol 个数缓存 SQL 文本：同样长度的批量请求复用同一字符串，也能命中 sqlite3 的语句缓存。
+       每个 symbol 一个 ORDER BY date DESC LIMIT 2 子查询，各自只在 (name, date) 索引上倒序取两行，
+       再 UNION ALL 成一次执行（不用窗口函数：那会把每个 symbol 的全部历史读出来排序再丢掉）。"""
+    per_symbol = ('SELECT * FROM (SELECT name, call, put, price, change, iv, date FROM "Options" '
+                  'WHERE name = ? ORDER BY date DESC LIMIT 2)')
+    return " UNION ALL ".join([per_symbol] * n)
+
 # 6. 获取期权 Call/Put 汇总数据 (修改版：支持单体 symbol 或 批量 symbols)
 @app.route('/api/Finance/query/options_summary', methods=['GET'])
 def query_options_summary():
@@ -3315,7 +3991,7 @@ def query_options_summary():
     symbol_param = request.args.get('symbol')
     symbols_param = request.args.get('symbols')
     db = get_finance_db()
-    if not db: return jsonify({"error": "Database not found"}), 500
+    if not db: return ojsonify({"error": "Database not found"}, 500)
 
     # 统一构建待查询列表
     target_symbols = []
@@ -3324,22 +4000,23 @@ def query_options_summary():
     elif symbol_param:
         target_symbols = [symbol_param]
     if not target_symbols:
-        return jsonify({"error": "Missing parameters"}), 400
+        return ojsonify({"error": "Missing parameters"}, 400)
     try:
         results = {}
         
-        # 遍历查询 (虽然是循环，但比 HTTP 开销小得多，且本地 SQLite 很快)
-        # 如果追求极致性能可以用 SQL 的 IN 查询，但这里为了逻辑复用，循环足够了
+        # 【性能】每批 symbol 一次查询取回各自最新两天，代替逐个 symbol 往返执行
+        unique_symbols = list(dict.fromkeys(target_symbols))
+        rows_by_symbol = {}
+        for i in range(0, len(unique_symbols), OPTIONS_SUMMARY_BATCH):
+            batch = unique_symbols[i:i + OPTIONS_SUMMARY_BATCH]
+            for row in db.execute(_options_summary_sql(len(batch)), batch):
+                rows_by_symbol.setdefault(row["name"], []).append(row)
+        for rows in rows_by_symbol.values():
+            # UNION ALL 不保证各子查询内部的顺序能保留下来，按日期重排（每个 symbol 至多两行）
+            rows.sort(key=lambda r: r["date"], reverse=True)
+
         for sym in target_symbols:
-            query = '''
-                SELECT call, put, price, change, iv, date 
-                FROM "Options" 
-                WHERE name = ? 
-                ORDER BY date DESC 
-                LIMIT 2
-            '''
-            cur = db.execute(query, (sym,))
-            rows = cur.fetchall()
+            rows = rows_by_symbol.get(sym)
             if rows:
                 latest_row = rows[0]
                 prev_row = rows[1] if len(rows) > 1 else None
@@ -3360,47 +4037,40 @@ def query_options_summary():
 
         # 如果是单查，为了兼容旧逻辑，直接返回对象；如果是批量，返回字典
         if symbols_param:
-            return jsonify(results)
+            return ojsonify(results)
         else:
             # 保持兼容旧 API 的返回格式
             if target_symbols[0] in results:
-                return jsonify(results[target_symbols[0]])
+                return ojsonify(results[target_symbols[0]])
             else:
-                return jsonify({
+                return ojsonify({
                     "call": None, "put": None, 
                     "price": None, "change": None, 
                     "iv": None, "date": None,
                     "prev_iv": None, "prev_price": None, "prev_change": None
                 })
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return ojsonify({"error": str(e)}, 500)
     
 # 7. 获取期权历史价格走势 (新增)
 @app.route('/api/Finance/query/options_price_history', methods=['GET'])
 def query_options_price_history():
     symbol = request.args.get('symbol')
     
-    if not symbol: return jsonify({"error": "Missing parameters"}), 400
+    if not symbol: return ojsonify({"error": "Missing parameters"}, 400)
     
     db = get_finance_db()
-    if not db: return jsonify({"error": "Database not found"}), 500
+    if not db: return ojsonify({"error": "Database not found"}, 500)
     
     try:
         # 【修改点】增加了 iv 字段的查询
         query = 'SELECT date, price, iv FROM "Options" WHERE name = ? ORDER BY date DESC'
         cur = db.execute(query, (symbol,))
-        rows = cur.fetchall()
-        
-        result = []
-        for row in rows:
-            result.append({
-                "date": row["date"],
-                "price": row["price"],
-                "iv": row["iv"] # 新增返回 IV (字符串格式, 如 "50.5%")
-            })
-        return jsonify(result)
+        # 【性能】边读游标边输出，不再先拼出完整列表；IV 为字符串格式, 如 "50.5%"
+        items = ({"date": row["date"], "price": row["price"], "iv": row["iv"]} for row in cur)
+        return _json_array_response(items, "options_price_history")
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return ojsonify({"error": str(e)}, 500)
     
 # 8. 获取期权榜单 (修改 - Options Rank)
 # 逻辑：利用数据库 change 字段，移除 Self-Join，极大提高性能
@@ -3409,14 +4079,14 @@ def query_options_rank():
     # 获取客户端传来的市值阀值，如果没有传则默认 500亿
     limit = request.args.get('limit', default=50000000000, type=float)
     db = get_finance_db()
-    if not db: return jsonify({"error": "Database not found"}), 500
+    if not db: return ojsonify({"error": "Database not found"}, 500)
     
     try:
         # 1. 找到 Options 表中最新的两个日期
         cur = db.execute('SELECT DISTINCT date FROM "Options" ORDER BY date DESC LIMIT 2')
         date_rows = cur.fetchall()
         if not date_rows:
-             return jsonify({"rank_up": [], "rank_down": []})
+             return ojsonify({"rank_up": [], "rank_down": []})
         
         latest_date = date_rows[0]['date']
         # 如果有次新日期则获取，否则为 None
@@ -3454,9 +4124,10 @@ def query_options_rank():
             
             if raw_iv_latest:
                 try:
-                    clean_str = raw_iv_latest.replace('%', '').strip()
+                    # iv 列可能存成数字（REAL）而非 "44%" 这样的字符串，先统一转成 str
+                    clean_str = str(raw_iv_latest).replace('%', '').strip()
                     sort_val = float(clean_str)
-                except:
+                except ValueError:
                     sort_val = 0.0
             
             all_results.append({
@@ -3477,7 +4148,7 @@ def query_options_rank():
         all_results.sort(key=lambda x: x["sort_val"], reverse=True)
             
         if not all_results:
-             return jsonify({"rank_up": [], "rank_down": []})
+             return ojsonify({"rank_up": [], "rank_down": []})
              
         # 截取前20
         rank_up = all_results[:20]
@@ -3490,14 +4161,14 @@ def query_options_rank():
         for item in rank_up + rank_down:
             item.pop("sort_val", None)
 
-        return jsonify({
+        return ojsonify({
             "rank_up": rank_up,
             "rank_down": rank_down
         })
         
     except Exception as e:
-        print(f"Error querying options rank: {e}")
-        return jsonify({"error": str(e)}), 500
+        logger.error("Error querying options rank: %s", e)
+        return ojsonify({"error": str(e)}, 500)
 
 # ============================================
 
@@ -3755,11 +4426,11 @@ def admin_clear_db():
     data = request.get_json() or {}
     clear_type = data.get('type')  # 'analytics', 'users', 'all'
     
-    if clear_type not in ['analytics', 'users', 'all']:
+    if clear_type not in {'analytics', 'users', 'all'}:
         return jsonify({"error": "无效的清除类型"}), 400
     try:
         # 1. 清除行为统计数据
-        if clear_type in ['analytics', 'all']:
+        if clear_type in {'analytics', 'all'}:
             conn = sqlite3.connect(ANALYTICS_DB_PATH, timeout=30.0)
             c = conn.cursor()
             c.execute("DELETE FROM user_video_events")
@@ -3782,18 +4453,33 @@ def admin_clear_db():
             conn.close()
             
         # 2. 清除用户及订阅数据
-        if clear_type in ['users', 'all']:
-            conn = sqlite3.connect(USER_DB_PATH, timeout=30.0)
-            c = conn.cursor()
-            c.execute("DELETE FROM users")
-            c.execute("DELETE FROM finance_points")
-            c.execute("DELETE FROM finance_daily_unlocks")
-            conn.commit()
-            conn.close()
+        if clear_type in {'users', 'all'}:
+            with user_conn() as conn:
+                c = conn.cursor()
+                c.execute("BEGIN IMMEDIATE")
+                c.execute("DELETE FROM users")
+                c.execute("DELETE FROM finance_points")
+                c.execute("DELETE FROM finance_daily_unlocks")
+                c.execute("COMMIT")
+            status_cache_clear()
         return jsonify({"status": "success", "message": f"成功清空了 {clear_type} 相关的数据。"})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/admin/api/flush_finance_cache', methods=['POST'])
+@require_admin
+def admin_flush_finance_cache():
+    """Finance.db 导入/替换后调用：重新补建索引/统计信息，清空市值缓存，并让表名白名单在下次请求时重新加载"""
+    global _finance_tables, _finance_tables_loaded_at
+    try:
+        ensure_finance_indexes(os.stat(FINANCE_DB_PATH).st_ino, force=True)
+    except OSError:
+        pass   # 库文件暂时不存在：之后的请求发现新 inode 时会自动补建
+    _market_cap_cache.clear()
+    _finance_tables = frozenset()
+    _finance_tables_loaded_at = None
+    return jsonify({"status": "success"})
+
 # Dashboard 网页本体
 @app.route('/admin', methods=['GET'])
 def admin_page():
@@ -5069,18 +5755,24 @@ document.addEventListener('keydown', function(e) {
 </html>
 '''
 
-# --- 服务器启动 ---
-if __name__ == '__main__':
-    # 【新增】在启动时初始化数据库
+def init_databases():
+    """启动时的建表/迁移/索引检查；本地直跑与 gunicorn (见 gunicorn.conf.py) 共用"""
     init_user_db()
     init_analytics_db()
+    init_finance_db()
     ensure_video_db()        # ← 新增：启动时构建/检查 OVideo.db
-    supported_apps_str = ", ".join(ALLOWED_APPS)
-    print("多应用服务器正在启动...")
-    print(f"支持的应用: {supported_apps_str}")
-    print(f"资源目录被定位在: {BASE_RESOURCES_DIR}")
+
+# --- 服务器启动 ---
+# 本地调试直接 python AppServer.py；生产环境用 gunicorn -c gunicorn.conf.py AppServer:app
+if __name__ == '__main__':
+    # 【新增】在启动时初始化数据库
+    init_databases()
+    supported_apps_str = ", ".join(sorted(ALLOWED_APPS))
+    logger.info("多应用服务器正在启动...")
+    logger.info("支持的应用: %s", supported_apps_str)
+    logger.info("资源目录被定位在: %s", BASE_RESOURCES_DIR)
     host_ip = '0.0.0.0'
     port = 5001
-    print("请确保您的手机和电脑连接到同一个Wi-Fi网络")
-    print(f"在iOS App中请使用 http://{host_ip}:{port}/api/ONews/... 访问")
+    logger.info("请确保您的手机和电脑连接到同一个Wi-Fi网络")
+    logger.info("在iOS App中请使用 http://%s:%s/api/ONews/... 访问", host_ip, port)
     app.run(host=host_ip, port=port, debug=False, threaded=True)
\ No newline at end of file
@@ -0,0 +1,45 @@
+# gunicorn 生产启动配置：
+#   gunicorn -c gunicorn.conf.py AppServer:app
+# 取代 app.run() 的单进程开发服务器，gthread worker 用线程池并发处理请求。
+import os
+import subprocess
+import sys
+
+# 【关键】gunicorn 只监听本机，必须由 nginx（nginx.conf）在前面接流量：
+# gthread 下一个请求从读请求到发完响应体都占着一个线程，慢客户端、大文件下载直接连过来，
+# 十几个并发下载就能占满线程池、饿死所有 API 请求。nginx 负责缓冲响应、直接发送静态下载
+bind = '127.0.0.1:5001'
+# 漏到 Flask 的下载（nginx try_files 未命中时）也只返回 X-Accel-Redirect 响应头，文件本体由 nginx 发送
+raw_env = ['APP_X_ACCEL_PREFIX=/protected']
+# 【性能】用 gthread 而不是 gevent：sqlite3 的查询是阻塞的 C 调用，不会让出 gevent 的事件循环，
+# 一条慢查询会卡住同进程的所有协程；真线程下 sqlite3 执行期间释放 GIL，
+# WAL 的“读写互不阻塞”才能让多个 Finance 查询 / 登录写入真正并行。
+# 线程级长连接（get_conn）在 gthread 下也回到每线程一条、跨请求复用
+worker_class = 'gthread'
+# ADMIN_TOKENS、举报/许愿限流字典等都放在进程内存里，多进程之间互相看不到，
+# 所以只开 1 个 worker，靠线程池承载并发
+workers = 1
+threads = 16
+# 同时在处理（含发送响应体）的请求最多 threads 个；keep-alive 空闲连接只挂在 poller 上、不占线程。
+# 连接上限放宽到 1000，容纳 nginx upstream keepalive 的空闲连接
+worker_connections = 1000
+timeout = 120
+# 未配置 X-Accel 时（如临时去掉 raw_env），下载接口走 send_from_directory -> wrap_file(environ['wsgi.file_wrapper'])，
+# 由 gunicorn 的 FileWrapper 调用 sendfile(2) 零拷贝发送，但整个传输期间仍占一个线程。
+# 显式打开，防止被环境变量/命令行 --no-sendfile 关掉
+sendfile = True
+
+def post_fork(server, worker):
+    """worker fork 之后、加载 AppServer 之前执行：把生效的线程数（含命令行 --threads 覆盖）传给应用，
+       用户库连接池按它定大小，两边始终一致"""
+    os.environ['APP_THREADS'] = str(worker.cfg.threads)
+
+def on_starting(server):
+    """master 启动时（fork worker 之前）做一次建表/迁移/索引检查。
+       放在独立子进程里执行：master 若直接 import AppServer，worker 会 fork 继承这份模块，
+       而 import 时启动的日志 QueueListener 线程不会随 fork 复制，worker 里的日志就没人写出了。"""
+    subprocess.run(
+        [sys.executable, '-c', 'import AppServer; AppServer.init_databases()'],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        check=True,
+    )